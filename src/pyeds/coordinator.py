@@ -6,27 +6,229 @@ Coordinator provides interface for following classes:
     * Task: A class that provides simultaneous processing.
     * Timer: A time delay.
     * Queue: A data queue.
+    * Watcher: Calls a handler when a file object is ready for I/O.
 
 Following functions are provided:
     * current: Returns the current thread of execution.
+    * deliver: Delivers the items of timer handlers in batches.
 
 By default the Python standard library is used for this functionality.
 
+A task is created with the state machine ``event_loop`` method as target, a
+name and the event queue of the state machine. After creation the task gets
+the ``sm`` attribute which refers to the state machine. Providers which
+dedicate a thread to each task simply run the target. Providers which share
+threads between tasks do not run the target; instead they call
+``sm.event_loop_start()`` once and then ``sm.event_loop_step(item)`` for each
+item taken from the queue, until it returns ``False``.
+
+Available providers:
+    * std: Each task runs in its own thread. Timers of all tasks are executed
+      by a single thread, see :class:`TimerService`, and file objects of all
+      tasks are watched by a single thread, see :class:`IoService`.
+    * pool: Tasks are executed by a fixed pool of worker threads, see
+      :func:`pool_provider`.
+    * asyncio: Tasks are asyncio tasks of an event loop, see
+      :func:`asyncio_provider`.
+    * shm: Tasks run in their own threads and queues are ring buffers in
+      shared memory, so producers in other processes put events directly, see
+      :func:`shm_provider`.
+
 Module details
 --------------
 
 Created on Jul 22, 2017
 """
 
+import bisect
 import collections
+import logging
+import os
 
 providers = {}
 provider = None
 
+_logger = logging.getLogger(__name__)
+
 
 Provider = collections.namedtuple(
     'Provider',
-    ['Task', 'Timer', 'Lock', 'Queue', 'current'])
+    ['Task', 'Timer', 'Lock', 'Queue', 'current', 'Watcher'])
+
+
+OVERFLOW_POLICIES = (
+    'block', 'reject', 'drop_oldest', 'drop_newest', 'coalesce')
+
+
+class _Slot:
+    """Position of a coalescible item in a buffer level."""
+    __slots__ = ('item', 'key')
+
+    def __init__(self, item, key):
+        self.item = item
+        self.key = key
+
+
+class Buffer:
+    """Items of a queue together with the policy used when the queue is full.
+
+    Overflow policies:
+        * block: The producer waits for room if it is willing to block,
+          otherwise ``BufferError`` is raised.
+        * reject: ``BufferError`` is raised without waiting.
+        * drop_oldest: The oldest queued item of the lowest priority is
+          dropped to make room. The new item is dropped when its priority is
+          lower than the priority of all queued items.
+        * drop_newest: The new item is dropped.
+        * coalesce: The new item replaces the newest queued item with the same
+          name and priority. ``BufferError`` is raised when there is no such
+          item.
+
+    Independently of the policy, an item with a true ``is_coalescible``
+    attribute is merged with the queued item which has the same
+    ``coalesce_key()``. The result of ``item.merge(queued)`` takes the
+    position of the queued item, so coalescing never needs room.
+
+    The buffer is not thread safe, a queue uses it while holding its lock. The
+    ``None`` item, which requests termination of a task, is always accepted.
+
+    Args:
+        * maxsize (:obj:`int`, *optional*): Maximum number of items, zero or
+          less means no limit. Default is 0.
+        * overflow (:obj:`str`, *optional*): One of :data:`OVERFLOW_POLICIES`.
+          Default is ``'block'``.
+
+    Raises:
+        * ValueError: When *overflow* is not a known policy.
+    """
+    def __init__(self, maxsize=0, overflow='block'):
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError(
+                'overflow policy {!r} is invalid'.format(overflow))
+        self.maxsize = maxsize
+        self.overflow = overflow
+        self.dropped = 0
+        self.coalesced = 0
+        self._size = 0
+        # Levels are kept once created, most buffers use a single level
+        self._levels = {0: collections.deque()}
+        # Negated priorities of levels, the highest priority is first
+        self._order = [0]
+        # Slots of queued coalescible items by their key
+        self._slots = {}
+
+    def __len__(self):
+        return self._size
+
+    def _level(self, priority):
+        level = self._levels.get(priority)
+        if level is None:
+            level = self._levels[priority] = collections.deque()
+            bisect.insort(self._order, -priority)
+        return level
+
+    def _unwrap(self, item):
+        if item.__class__ is _Slot:
+            del self._slots[item.key]
+            return item.item
+        return item
+
+    def needs_room(self, item):
+        """Is the buffer too full to simply add the item?"""
+        if item is None or not 0 < self.maxsize <= self._size:
+            return False
+        if getattr(item, 'is_coalescible', False):
+            return item.coalesce_key() not in self._slots
+        return True
+
+    def push(self, item, priority=0):
+        """Add an item applying coalescing and the overflow policy.
+
+        Items are taken from the highest priority level first. Within a level
+        items are taken in the order in which they were added.
+
+        Args:
+            * item (:obj:`object`): Item to add.
+            * priority (:obj:`int`, *optional*): Priority level of the item.
+              Default is 0.
+
+        Returns:
+            * :obj:`tuple`: Items which were dropped or replaced, the tuple is
+              empty when nothing was discarded.
+
+        Raises:
+            * BufferError: When the buffer is full and the policy does not
+              discard anything.
+        """
+        if getattr(item, 'is_coalescible', False):
+            key = item.coalesce_key()
+            slot = self._slots.get(key)
+            if slot is not None:
+                queued = slot.item
+                slot.item = item.merge(queued)
+                self.coalesced += 1
+                return tuple(
+                    x for x in (queued, item) if x is not slot.item)
+            if self.needs_room(item):
+                return self._overflow(item, priority)
+            slot = self._slots[key] = _Slot(item, key)
+            self._level(priority).append(slot)
+            self._size += 1
+            return ()
+        if not self.needs_room(item):
+            self._level(priority).append(item)
+            self._size += 1
+            return ()
+        return self._overflow(item, priority)
+
+    def _overflow(self, item, priority):
+        if self.overflow == 'drop_oldest':
+            # The oldest item of the lowest priority level is dropped
+            for key in reversed(self._order):
+                level = self._levels[-key]
+                if level:
+                    break
+            if level[0] is None or -key > priority:
+                self.dropped += 1
+                return (item,)
+            discarded = self._unwrap(level.popleft())
+            self._size -= 1
+            self.dropped += 1
+            self.push(item, priority)
+            return (discarded,)
+        if self.overflow == 'drop_newest':
+            self.dropped += 1
+            return (item,)
+        if self.overflow == 'coalesce':
+            level = self._levels.get(priority, ())
+            for idx in range(len(level) - 1, -1, -1):
+                queued = level[idx]
+                if queued.__class__ is _Slot:
+                    queued = queued.item
+                if queued is not None and queued.name == item.name:
+                    self._unwrap(level[idx])
+                    level[idx] = item
+                    self.coalesced += 1
+                    return (queued,)
+        raise BufferError
+
+    def pop(self):
+        for key in self._order:
+            level = self._levels[-key]
+            if level:
+                self._size -= 1
+                return self._unwrap(level.popleft())
+        raise IndexError('pop from an empty buffer')
+
+    def clear(self):
+        """Remove all items and return them in the order of taking."""
+        items = []
+        for key in self._order:
+            level = self._levels[-key]
+            items += [self._unwrap(item) for item in level]
+            level.clear()
+        self._size = 0
+        return items
 
 
 def set_provider(name):
@@ -51,36 +253,1370 @@ def set_provider(name):
 # ****************************************************************************
 
 try:
+    import heapq
+    import itertools
+    import selectors
+    import socket
     import threading
+    import time
     import queue
 
+    def _endtime(timeout):
+        if timeout is None:
+            return None
+        return time.monotonic() + timeout
+
+    def _remaining(endtime):
+        if endtime is None:
+            return None
+        return endtime - time.monotonic()
+
     class StdTask(threading.Thread):
-        def __init__(self, target, name):
+        def __init__(self, target, name, queue=None):
             super().__init__(target=target, name=name, daemon=True)
 
-    class StdTimer(threading.Timer):
-        def __init__(self, interval, handler):
+    class TimerService:
+        """Executes timer handlers from a single thread.
+
+        Armed timers are kept in a heap ordered by deadline. Cancelling a
+        timer only marks its heap entry, the entry is discarded when it
+        reaches the top of the heap. The thread is started on first use and
+        is started again in a child process after ``fork()``.
+
+        A timer may allow some slack: it may expire at any time between its
+        deadline and its deadline plus slack. The service wakes up at the
+        latest time allowed by the most urgent timer and then executes all
+        timers whose deadlines have passed, so timers with overlapping windows
+        are executed in a single wake-up. A second heap ordered by the latest
+        allowed time is kept for that purpose. Items which the handlers give
+        to :func:`deliver` are delivered in batches after all handlers of the
+        wake-up have been executed.
+        """
+        def __init__(self):
+            self._heap = []
+            self._latest = []
+            self._sequence = itertools.count()
+            self._pid = None
+            self._cancelled = 0
+            self._cond = None
+            self._thread = None
+
+        def _start_thread(self):
+            self._pid = os.getpid()
+            self._heap = []
+            self._latest = []
+            self._cancelled = 0
+            self._cond = threading.Condition(threading.Lock())
+            self._thread = threading.Thread(
+                target=self._run, name='timer-service', daemon=True)
+            self._thread.start()
+
+        def _discard(self):
+            while self._heap and self._heap[0][2] is None:
+                heapq.heappop(self._heap)
+                self._cancelled -= 1
+            while self._latest and self._latest[0][2][2] is None:
+                heapq.heappop(self._latest)
+
+        def _expired(self):
+            # Wait until the most urgent timer can't wait any longer and
+            # collect all expired timers
+            with self._cond:
+                while True:
+                    self._discard()
+                    if not self._heap:
+                        self._cond.wait()
+                        continue
+                    now = time.monotonic()
+                    timeout = self._latest[0][0] - now
+                    if timeout > 0:
+                        self._cond.wait(timeout)
+                        continue
+                    handlers = []
+                    while self._heap and self._heap[0][0] <= now:
+                        entry = heapq.heappop(self._heap)
+                        if entry[2] is None:
+                            self._cancelled -= 1
+                        else:
+                            handlers += [entry[2]]
+                            entry[2] = None
+                    return handlers
+
+        def _run(self):
+            while True:
+                handlers = self._expired()
+                batches = _batches.items = {}
+                try:
+                    for handler in handlers:
+                        try:
+                            handler()
+                        except Exception:
+                            _logger.exception('timer handler failed')
+                finally:
+                    _batches.items = None
+                for flush, items in batches.items():
+                    try:
+                        flush(items)
+                    except Exception:
+                        _logger.exception('timer delivery failed')
+
+        def schedule(self, deadline, handler, slack=0.0):
+            """Arm a timer.
+
+            Args:
+                * deadline (:obj:`float`): Absolute time of expiry, as
+                  returned by ``time.monotonic()``.
+                * handler (:obj:`function`): Function called on expiry.
+                * slack (:obj:`float`, *optional*): How many seconds after
+                  the deadline the timer may expire. Default is 0.
+
+            Returns:
+                * :obj:`list`: Timer entry used to cancel the timer.
+            """
+            if self._pid != os.getpid():
+                with _service_lock:
+                    if self._pid != os.getpid():
+                        self._start_thread()
+            sequence = next(self._sequence)
+            entry = [deadline, sequence, handler]
+            latest = (deadline + slack, sequence, entry)
+            with self._cond:
+                heapq.heappush(self._heap, entry)
+                heapq.heappush(self._latest, latest)
+                if self._latest[0] is latest:
+                    self._cond.notify()
+            return entry
+
+        def cancel(self, entry):
+            """Cancel an armed timer.
+
+            Args:
+                * entry (:obj:`list`): Timer entry returned by
+                  :meth:`schedule`.
+            """
+            with self._cond:
+                if entry[2] is None:
+                    return
+                entry[2] = None
+                self._cancelled += 1
+                # Don't let cancelled entries pile up in the heaps
+                if self._cancelled > len(self._heap) // 2:
+                    self._heap = [e for e in self._heap if e[2] is not None]
+                    heapq.heapify(self._heap)
+                    self._latest = [
+                        e for e in self._latest if e[2][2] is not None]
+                    heapq.heapify(self._latest)
+                    self._cancelled = 0
+
+    _service_lock = threading.Lock()
+    _batches = threading.local()
+    timer_service = TimerService()
+
+    def deliver(flush, item):
+        """Deliver an item produced by a timer handler.
+
+        Handlers executed by :class:`TimerService` in one wake-up have their
+        items delivered in batches: *flush* is called once after all handlers
+        of the wake-up have been executed, with the list of all items given
+        for it. Elsewhere *flush* is called at once with a list of the single
+        item.
+
+        Args:
+            * flush (:obj:`function`): Function which takes a list of items.
+              Items are grouped by equal functions, for example bound methods
+              of the same object.
+            * item (:obj:`object`): Item to deliver.
+        """
+        batch = getattr(_batches, 'items', None)
+        if batch is None:
+            flush([item])
+        else:
+            batch.setdefault(flush, []).append(item)
+
+    class StdTimer:
+        def __init__(self, interval, handler, slack=0.0):
+            self.interval = interval
+            self.slack = slack
             self._handler = handler
-            super().__init__(interval, self.callback)
+            self._entry = None
 
-        def callback(self, *_args, **_kwargs):
-            self._handler()
+        def start(self):
+            self._entry = timer_service.schedule(
+                time.monotonic() + self.interval, self._handler, self.slack)
 
-    class StdQueue(queue.Queue):
-        def put(self, item, block=False, timeout=None):
+        def cancel(self):
+            if self._entry is not None:
+                timer_service.cancel(self._entry)
+
+    class IoService:
+        """Watches file objects from a single thread.
+
+        File objects are watched with the default selector of the
+        ``selectors`` module. The handler of a watch is called from the thread
+        each time its file object is ready, until the watch is cancelled.
+        Watches are added and cancelled by any thread: the changes are queued
+        and the thread is woken up through a socket pair to apply them. The
+        thread is started on first use and is started again in a child
+        process after ``fork()``.
+
+        A file object can be watched for reading and for writing at the same
+        time, by two watches.
+        """
+        def __init__(self):
+            self._pid = None
+            self._lock = None
+            self._selector = None
+            self._wakeup = None
+            self._changes = []
+            self._thread = None
+
+        def _start_thread(self):
+            self._pid = os.getpid()
+            self._lock = threading.Lock()
+            self._selector = selectors.DefaultSelector()
+            self._wakeup = socket.socketpair()
+            for sock in self._wakeup:
+                sock.setblocking(False)
+            self._selector.register(
+                self._wakeup[0], selectors.EVENT_READ, None)
+            self._changes = []
+            self._thread = threading.Thread(
+                target=self._run, name='io-service', daemon=True)
+            self._thread.start()
+
+        def _apply(self):
+            with self._lock:
+                changes, self._changes = self._changes, []
+            for entry in changes:
+                # A failed change must not stop watching the other file
+                # objects, usually the file object was closed before the
+                # change
+                try:
+                    self._apply_change(entry)
+                except Exception:
+                    _logger.exception(
+                        'watch of {!r} can not be changed'.format(entry[0]))
+
+        def _apply_change(self, entry):
+            fileobj, mask = entry[0], entry[1]
             try:
-                super().put(item, block, timeout)
-            except queue.Full:
-                raise BufferError
+                watches = self._selector.get_key(fileobj).data
+                is_registered = True
+            except (KeyError, ValueError):
+                # ValueError is raised for a closed file object which is not
+                # registered
+                watches = {}
+                is_registered = False
+            if entry[2] is not None:
+                watches[mask] = entry
+            elif watches.get(mask) is entry:
+                del watches[mask]
+            events = 0
+            for watched in watches:
+                events |= watched
+            if not is_registered:
+                if events:
+                    self._selector.register(fileobj, events, watches)
+            elif not events:
+                self._selector.unregister(fileobj)
+            else:
+                self._selector.modify(fileobj, events, watches)
+
+        def _run(self):
+            while True:
+                self._apply()
+                for key, events in self._selector.select():
+                    watches = key.data
+                    if watches is None:
+                        try:
+                            while self._wakeup[0].recv(4096):
+                                pass
+                        except OSError:
+                            pass
+                        continue
+                    for mask in (selectors.EVENT_READ, selectors.EVENT_WRITE):
+                        entry = watches.get(mask) if events & mask else None
+                        if entry is None or entry[2] is None:
+                            continue
+                        try:
+                            entry[2]()
+                        except Exception:
+                            _logger.exception('watch handler failed')
+
+        def _change(self, entry):
+            if self._pid != os.getpid():
+                with _service_lock:
+                    if self._pid != os.getpid():
+                        self._start_thread()
+            with self._lock:
+                self._changes += [entry]
+            if threading.current_thread() is not self._thread:
+                try:
+                    self._wakeup[1].send(b'\0')
+                except OSError:
+                    # The thread has enough wake-ups pending already
+                    pass
+
+        def watch(self, entry):
+            """Start watching a file object.
+
+            The handler may be called before this method returns, so the
+            caller keeps the entry before the call.
+
+            Args:
+                * entry (:obj:`list`): Watch entry which is used to cancel the
+                  watch. It holds the file descriptor or an object with a
+                  ``fileno()`` method, ``selectors.EVENT_READ`` or
+                  ``selectors.EVENT_WRITE`` and the function called each time
+                  the file object is ready.
+            """
+            self._change(entry)
+
+        def cancel(self, entry):
+            """Stop watching a file object.
+
+            The handler is not called after this method returns, unless the
+            thread is calling it at the same time.
+
+            Args:
+                * entry (:obj:`list`): Watch entry returned by :meth:`watch`.
+            """
+            if entry[2] is None:
+                return
+            entry[2] = None
+            self._change(entry)
+
+    io_service = IoService()
+
+    class StdWatcher:
+        def __init__(self, fileobj, writable, handler):
+            self.fileobj = fileobj
+            self.writable = writable
+            self._handler = handler
+            self._entry = None
+
+        def start(self):
+            if self.writable:
+                events = selectors.EVENT_WRITE
+            else:
+                events = selectors.EVENT_READ
+            self._entry = [self.fileobj, events, self._handler]
+            io_service.watch(self._entry)
+
+        def cancel(self):
+            if self._entry is not None:
+                io_service.cancel(self._entry)
+
+    class StdQueue(queue.Queue):
+        def __init__(self, maxsize=0, overflow='block'):
+            self.buffer = Buffer(maxsize, overflow)
+            super().__init__(maxsize)
+
+        @property
+        def dropped(self):
+            return self.buffer.dropped
+
+        @property
+        def coalesced(self):
+            return self.buffer.coalesced
+
+        def _init(self, maxsize):
+            self.queue = self.buffer
+
+        def _get(self):
+            return self.buffer.pop()
+
+        def _add(self, item, block, endtime, priority):
+            # Called with the mutex held
+            if block and self.buffer.overflow == 'block':
+                if not self.not_full.wait_for(
+                        lambda: not self.buffer.needs_room(item),
+                        _remaining(endtime)):
+                    raise BufferError
+            size = len(self.buffer)
+            discarded = self.buffer.push(item, priority)
+            if len(self.buffer) > size:
+                self.unfinished_tasks += 1
+                self.not_empty.notify()
+            return discarded
+
+        def put(self, item, block=False, timeout=None, priority=0):
+            """Put an item and return a tuple of discarded items."""
+            with self.not_full:
+                return self._add(item, block, _endtime(timeout), priority)
+
+        def put_many(
+                self, items, block=False, timeout=None, priorities=None):
+            """Put items in order under one lock acquisition.
+
+            The *priorities* sequence gives the priority of each item, all
+            items have priority 0 when it is not given. Returns a list of
+            discarded items. BufferError is
+            raised with the number of queued items and the list of discarded
+            items as the arguments when the queue is full.
+            """
+            endtime = _endtime(timeout)
+            count = 0
+            discarded = []
+            if priorities is None:
+                priorities = itertools.repeat(0)
+            with self.not_full:
+                for item, priority in zip(items, priorities):
+                    try:
+                        dropped = self._add(item, block, endtime, priority)
+                    except BufferError:
+                        raise BufferError(count, discarded)
+                    discarded += dropped
+                    count += 1
+            return discarded
+
+        def clear(self):
+            """Remove all queued items and return them."""
+            with self.mutex:
+                items = self.buffer.clear()
+                self.unfinished_tasks -= len(items)
+                if not self.unfinished_tasks:
+                    self.all_tasks_done.notify_all()
+                self.not_full.notify_all()
+                return items
+
+        def get_many(self, max_items):
+            """Wait for an item and take up to *max_items* queued items."""
+            with self.not_empty:
+                while not self._qsize():
+                    self.not_empty.wait()
+                items = []
+                while self._qsize() and len(items) < max_items:
+                    items += [self._get()]
+                self.not_full.notify(len(items))
+                return items
+
+        def task_done(self, count=1):
+            with self.all_tasks_done:
+                unfinished = self.unfinished_tasks - count
+                if unfinished < 0:
+                    raise ValueError('task_done() called too many times')
+                if unfinished == 0:
+                    self.all_tasks_done.notify_all()
+                self.unfinished_tasks = unfinished
 
     providers['std'] = Provider(
         Task=StdTask,
         Timer=StdTimer,
         Lock=threading.Lock,
         Queue=StdQueue,
-        current=threading.current_thread)
+        current=threading.current_thread,
+        Watcher=StdWatcher)
 
     if provider is None:
         set_provider('std')
 except ImportError:
     pass
+
+
+# ****************************************************************************
+# Setup thread pool provider
+# ****************************************************************************
+
+try:
+    import itertools
+    import threading
+    import queue
+
+    class PoolScheduler:
+        """Executes pool tasks on a fixed number of worker threads.
+
+        Ready tasks wait in a single FIFO queue. A worker takes a task, lets
+        it process a bounded number of items and puts it back at the end of
+        the queue if it still has pending items, which gives each task with
+        pending items a fair share of the workers. A task is never in the
+        ready queue more than once, so a task is never executed by two
+        workers at the same time.
+
+        Args:
+            * workers (:obj:`int`): Number of worker threads. The threads are
+              started when the first task becomes ready.
+            * quantum (:obj:`int`, *optional*): Maximum number of items a task
+              processes before it yields the worker. Default is 16.
+        """
+        def __init__(self, workers, quantum=16):
+            self.workers = workers
+            self.quantum = quantum
+            self.local = threading.local()
+            self._ready = queue.Queue()
+            self._threads = []
+            self._lock = threading.Lock()
+
+        def _start_workers(self):
+            with self._lock:
+                if self._threads:
+                    return
+                for idx in range(self.workers):
+                    thread = threading.Thread(
+                        target=self._worker,
+                        name='pool-worker-{}'.format(idx),
+                        daemon=True)
+                    thread.start()
+                    self._threads += [thread]
+
+        def _worker(self):
+            while True:
+                task = self._ready.get()
+                self.local.task = task
+                try:
+                    task.run(self.quantum)
+                finally:
+                    self.local.task = None
+
+        def schedule(self, task):
+            if not self._threads:
+                self._start_workers()
+            self._ready.put(task)
+
+        def current(self):
+            task = getattr(self.local, 'task', None)
+            if task is None:
+                return threading.current_thread()
+            return task
+
+    class PoolQueue:
+        def __init__(self, maxsize=0, overflow='block'):
+            self.buffer = Buffer(maxsize, overflow)
+            self.task = None
+            self.mutex = threading.Lock()
+            self.not_full = threading.Condition(self.mutex)
+            self.not_empty = threading.Condition(self.mutex)
+            self._started = False
+            # Is the task in the ready queue or running
+            self._scheduled = False
+
+        @property
+        def dropped(self):
+            return self.buffer.dropped
+
+        @property
+        def coalesced(self):
+            return self.buffer.coalesced
+
+        def _add(self, item, block, endtime, priority):
+            # Called with the mutex held
+            if block and self.buffer.overflow == 'block':
+                if self.buffer.needs_room(item):
+                    # The task has to run to make room
+                    self._schedule_locked()
+                if not self.not_full.wait_for(
+                        lambda: not self.buffer.needs_room(item),
+                        _remaining(endtime)):
+                    raise BufferError
+            size = len(self.buffer)
+            discarded = self.buffer.push(item, priority)
+            if len(self.buffer) > size:
+                self.not_empty.notify()
+                self._schedule_locked()
+            return discarded
+
+        def put(self, item, block=False, timeout=None, priority=0):
+            with self.not_full:
+                return self._add(item, block, _endtime(timeout), priority)
+
+        def put_many(
+                self, items, block=False, timeout=None, priorities=None):
+            endtime = _endtime(timeout)
+            count = 0
+            discarded = []
+            if priorities is None:
+                priorities = itertools.repeat(0)
+            with self.not_full:
+                for item, priority in zip(items, priorities):
+                    try:
+                        dropped = self._add(item, block, endtime, priority)
+                    except BufferError:
+                        raise BufferError(count, discarded)
+                    discarded += dropped
+                    count += 1
+            return discarded
+
+        def _schedule_locked(self):
+            if self._started and not self._scheduled:
+                self._scheduled = True
+                self.task.scheduler.schedule(self.task)
+
+        def get(self, block=True, timeout=None):
+            with self.not_empty:
+                if not self.buffer:
+                    if not block or not self.not_empty.wait_for(
+                            lambda: self.buffer, timeout):
+                        raise queue.Empty
+                self.not_full.notify()
+                return self.buffer.pop()
+
+        def clear(self):
+            with self.mutex:
+                items = self.buffer.clear()
+                self.not_full.notify_all()
+                return items
+
+        def get_many(self, max_items):
+            with self.not_empty:
+                self.not_empty.wait_for(lambda: self.buffer)
+                items = []
+                while self.buffer and len(items) < max_items:
+                    items += [self.buffer.pop()]
+                self.not_full.notify(len(items))
+                return items
+
+        def task_done(self, count=1):
+            pass
+
+        def qsize(self):
+            return len(self.buffer)
+
+        def take(self):
+            """Take an item for the task or mark the task as not scheduled
+            when there are no items.
+            """
+            with self.mutex:
+                if not self.buffer:
+                    self._scheduled = False
+                    return False, None
+                self.not_full.notify()
+                return True, self.buffer.pop()
+
+        def start(self):
+            with self.mutex:
+                self._started = True
+                if self._scheduled:
+                    return
+                self._scheduled = True
+            self.task.scheduler.schedule(self.task)
+
+    class PoolTask:
+        def __init__(self, scheduler, target, name, queue):
+            self.scheduler = scheduler
+            self.name = name
+            self.started = False
+            self._queue = queue
+            self._initialized = False
+            self._finished = threading.Event()
+            queue.task = self
+
+        def start(self):
+            if self.started:
+                raise RuntimeError('task can only be started once')
+            self.started = True
+            self._queue.start()
+
+        def run(self, quantum):
+            if self._finished.is_set():
+                return
+            try:
+                if not self._initialized:
+                    self._initialized = True
+                    self.sm.event_loop_start()
+                for _ in range(quantum):
+                    has_item, item = self._queue.take()
+                    if not has_item:
+                        return
+                    if not self.sm.event_loop_step(item):
+                        self._finished.set()
+                        return
+            except Exception:
+                # The task dies like a thread would, but the worker survives
+                _logger.exception('task {} failed'.format(self.name))
+                self._finished.set()
+                return
+            # Quantum is used up, give other tasks a chance
+            self.scheduler.schedule(self)
+
+        def join(self, timeout=None):
+            self._finished.wait(timeout)
+
+        def is_alive(self):
+            return self.started and not self._finished.is_set()
+
+    def pool_provider(workers=None, quantum=16):
+        """Create a provider which executes tasks on a pool of threads.
+
+        Any number of state machines can share the pool. Each state machine
+        still processes one event at a time and is never executed by two
+        workers at once.
+
+        Args:
+            * workers (:obj:`int`, *optional*): Number of worker threads.
+              Default is ``None`` which means the number of CPUs.
+            * quantum (:obj:`int`, *optional*): Maximum number of events a
+              state machine processes before it yields the worker to another
+              state machine. Default is 16.
+
+        Returns:
+            * :obj:`Provider`: A provider which can be registered in
+              ``providers``.
+
+        Note:
+            State machines executed by a pool should send events without
+            blocking. A worker blocked on a full queue can't execute other
+            state machines.
+        """
+        scheduler = PoolScheduler(workers or os.cpu_count() or 1, quantum)
+
+        def task(target, name, queue):
+            return PoolTask(scheduler, target, name, queue)
+
+        return Provider(
+            Task=task,
+            Timer=StdTimer,
+            Lock=threading.Lock,
+            Queue=PoolQueue,
+            current=scheduler.current,
+            Watcher=StdWatcher)
+
+    providers['pool'] = pool_provider()
+except ImportError:
+    pass
+
+
+# ****************************************************************************
+# Setup asyncio provider
+# ****************************************************************************
+
+try:
+    import asyncio
+    import contextvars
+    import itertools
+    import math
+    import threading
+
+    _async_current = contextvars.ContextVar('pyeds_task', default=None)
+
+    def _async_loop():
+        try:
+            return asyncio.get_running_loop()
+        except RuntimeError:
+            return asyncio.get_event_loop()
+
+    def _async_in_loop(loop):
+        try:
+            return asyncio.get_running_loop() is loop
+        except RuntimeError:
+            return False
+
+    class AsyncTask:
+        def __init__(self, target, name, queue=None):
+            self.name = name
+            self.loop = _async_loop()
+            self._queue = queue
+            self._task = None
+            self._finished = threading.Event()
+
+        async def _run(self):
+            _async_current.set(self)
+            try:
+                self.sm.event_loop_start()
+                while self.sm.event_loop_step(await self._queue.get()):
+                    pass
+            finally:
+                self._finished.set()
+
+        def _create(self):
+            self._task = self.loop.create_task(self._run())
+
+        def start(self):
+            if _async_in_loop(self.loop):
+                self._create()
+            else:
+                self.loop.call_soon_threadsafe(self._create)
+
+        def join(self, timeout=None):
+            # Blocking the loop would deadlock, return an awaitable instead
+            if _async_in_loop(self.loop):
+                return asyncio.wait([self._task], timeout=timeout)
+            self._finished.wait(timeout)
+
+        def is_alive(self):
+            return self._task is not None and not self._finished.is_set()
+
+    class AsyncTimer:
+        def __init__(self, interval, handler, slack=0.0):
+            self.interval = interval
+            self.slack = slack
+            self.loop = _async_loop()
+            self._handler = handler
+            self._handle = None
+
+        def _start(self):
+            deadline = self.loop.time() + self.interval
+            if self.slack > 0:
+                # Round up to a multiple of slack, timers with the same slack
+                # then expire together in one loop iteration
+                deadline = math.ceil(deadline / self.slack) * self.slack
+            self._handle = self.loop.call_at(deadline, self._handler)
+
+        def _cancel(self):
+            if self._handle is not None:
+                self._handle.cancel()
+
+        def start(self):
+            if _async_in_loop(self.loop):
+                self._start()
+            else:
+                self.loop.call_soon_threadsafe(self._start)
+
+        def cancel(self):
+            if _async_in_loop(self.loop):
+                self._cancel()
+            else:
+                self.loop.call_soon_threadsafe(self._cancel)
+
+    class AsyncWatcher:
+        def __init__(self, fileobj, writable, handler):
+            self.fileobj = fileobj
+            self.writable = writable
+            self.loop = _async_loop()
+            self._handler = handler
+
+        def _start(self):
+            if self.writable:
+                self.loop.add_writer(self.fileobj, self._handler)
+            else:
+                self.loop.add_reader(self.fileobj, self._handler)
+
+        def _cancel(self):
+            if self.writable:
+                self.loop.remove_writer(self.fileobj)
+            else:
+                self.loop.remove_reader(self.fileobj)
+
+        def start(self):
+            if _async_in_loop(self.loop):
+                self._start()
+            else:
+                self.loop.call_soon_threadsafe(self._start)
+
+        def cancel(self):
+            if _async_in_loop(self.loop):
+                self._cancel()
+            else:
+                self.loop.call_soon_threadsafe(self._cancel)
+
+    class AsyncQueue(asyncio.Queue):
+        def __init__(self, maxsize=0, overflow='block'):
+            self.buffer = Buffer(maxsize, overflow)
+            super().__init__(maxsize)
+            self.loop = _async_loop()
+
+        @property
+        def dropped(self):
+            return self.buffer.dropped
+
+        @property
+        def coalesced(self):
+            return self.buffer.coalesced
+
+        def _init(self, maxsize):
+            self._queue = self.buffer
+
+        def _get(self):
+            return self.buffer.pop()
+
+        def put_nowait(self, item, priority=0):
+            size = len(self.buffer)
+            discarded = self.buffer.push(item, priority)
+            if len(self.buffer) > size:
+                self._unfinished_tasks += 1
+                self._finished.clear()
+                self._wakeup_next(self._getters)
+            return discarded
+
+        def clear(self):
+            items = self.buffer.clear()
+            self._unfinished_tasks -= len(items)
+            if not self._unfinished_tasks:
+                self._finished.set()
+            # Waiting producers check for room again when they are woken up
+            while self._putters:
+                self._wakeup_next(self._putters)
+            return items
+
+        async def _wait_room(self, item):
+            # Same as waiting in asyncio.Queue.put() which can't be used
+            # because it doesn't pass the priority to put_nowait()
+            while self.buffer.needs_room(item):
+                putter = self.loop.create_future()
+                self._putters.append(putter)
+                try:
+                    await putter
+                except BaseException:
+                    putter.cancel()
+                    if putter in self._putters:
+                        self._putters.remove(putter)
+                    elif not self.buffer.needs_room(item):
+                        self._wakeup_next(self._putters)
+                    raise
+
+        async def _put_foreign(self, item, block, timeout, priority):
+            if block and self.buffer.overflow == 'block':
+                try:
+                    await asyncio.wait_for(self._wait_room(item), timeout)
+                except asyncio.TimeoutError:
+                    raise BufferError
+            return self.put_nowait(item, priority)
+
+        def put(self, item, block=False, timeout=None, priority=0):
+            # The loop can't block, a full queue always raises in the loop
+            if _async_in_loop(self.loop):
+                return self.put_nowait(item, priority)
+            return asyncio.run_coroutine_threadsafe(
+                self._put_foreign(item, block, timeout, priority),
+                self.loop).result()
+
+        async def _put_many_foreign(self, items, block, timeout, priorities):
+            count = 0
+            discarded = []
+            for item, priority in zip(items, priorities):
+                try:
+                    dropped = await self._put_foreign(
+                        item, block, timeout, priority)
+                except BufferError:
+                    raise BufferError(count, discarded)
+                discarded += dropped
+                count += 1
+            return discarded
+
+        def put_many(
+                self, items, block=False, timeout=None, priorities=None):
+            if priorities is None:
+                priorities = itertools.repeat(0)
+            if not _async_in_loop(self.loop):
+                return asyncio.run_coroutine_threadsafe(
+                    self._put_many_foreign(items, block, timeout, priorities),
+                    self.loop).result()
+            count = 0
+            discarded = []
+            for item, priority in zip(items, priorities):
+                try:
+                    dropped = self.put_nowait(item, priority)
+                except BufferError:
+                    raise BufferError(count, discarded)
+                discarded += dropped
+                count += 1
+            return discarded
+
+    def _async_current_task():
+        task = _async_current.get()
+        if task is None:
+            return threading.current_thread()
+        return task
+
+    def asyncio_provider():
+        """Create a provider which executes tasks in an asyncio event loop.
+
+        Each state machine is an asyncio task, its queue is an asyncio queue
+        and timers are scheduled with ``call_later``. File objects are
+        watched with ``add_reader`` and ``add_writer`` of the event loop, so
+        the loop must support them. Objects are bound to the
+        event loop which is running (or is the current event loop) when they
+        are created, so state machines should be created from the loop.
+
+        Events may be sent from the loop or from any other thread. Sending
+        from the loop never blocks: a full queue raises ``BufferError``.
+        Calling ``wait()`` of a state machine from the loop returns an
+        awaitable.
+
+        Returns:
+            * :obj:`Provider`: A provider which can be registered in
+              ``providers``.
+        """
+        return Provider(
+            Task=AsyncTask,
+            Timer=AsyncTimer,
+            Lock=threading.Lock,
+            Queue=AsyncQueue,
+            current=_async_current_task,
+            Watcher=AsyncWatcher)
+
+    providers['asyncio'] = asyncio_provider()
+except ImportError:
+    pass
+
+
+# ****************************************************************************
+# Setup shared memory provider
+# ****************************************************************************
+
+try:
+    import multiprocessing
+    import pickle
+    import queue
+    import struct
+    import threading
+    import time
+    from multiprocessing import shared_memory
+
+    # Header fields: head, tail, put count, get count, dropped, waiting
+    _HEAD, _TAIL, _PUT, _GOT, _DROPPED, _WAITING, _CLOSED = range(7)
+    _FIELD = struct.Struct('<Q')
+    _LENGTH = struct.Struct('<I')
+    _HEADER_SIZE = 64
+    _POLL = 0.0005
+
+    class PickleCodec:
+        """Encodes items with :mod:`pickle` protocol 5.
+
+        Buffers which are pickled out-of-band, like event payloads, are not
+        copied into the pickle. They are written to the queue after it, so
+        they are copied once by the producer and once by the consumer.
+        """
+        def encode(self, item):
+            buffers = []
+            data = pickle.dumps(item, 5, buffer_callback=buffers.append)
+            raws = [buffer.raw() for buffer in buffers]
+            header = struct.pack(
+                '<{}I'.format(len(raws) + 1),
+                len(raws), *(raw.nbytes for raw in raws))
+            return (header, data) + tuple(raws)
+
+        def decode(self, data):
+            count = _LENGTH.unpack_from(data)[0]
+            lengths = struct.unpack_from(
+                '<{}I'.format(count), data, _LENGTH.size)
+            start = _LENGTH.size * (count + 1)
+            end = offset = len(data) - sum(lengths)
+            buffers = []
+            for length in lengths:
+                buffers += [bytearray(data[offset:offset + length])]
+                offset += length
+            return pickle.loads(data[start:end], buffers=buffers)
+
+    class ShmQueue:
+        """Multi-producer, single-consumer queue in shared memory.
+
+        Items are encoded by the codec into a ring buffer of fixed size.
+        Producers in other processes put items without pipes or sockets, the
+        queue is given to them as an argument of ``multiprocessing.Process``.
+        Producers are serialized by a process shared lock and the consumer
+        takes items without locking. A consumer waiting for items is woken up
+        by a semaphore only when it announced that it waits.
+
+        Items are taken in the order in which they were put, priorities are
+        ignored. The consumer gets copies of the items. Room for one ``None``
+        item, which requests termination of a task, is always kept free and
+        the ``None`` item does not count against *maxsize*.
+
+        The consumer destroys the shared memory with :meth:`close`, a state
+        machine closes its queue when it terminates. Producers in all
+        processes then get ``ValueError``, also the ones waiting for room.
+
+        Args:
+            * maxsize (:obj:`int`, *optional*): Maximum number of queued
+              items. Default is 0 which means that the queue is limited by
+              its capacity only.
+            * overflow (:obj:`str`, *optional*): What happens to an item put
+              in a full queue: ``'block'``, ``'reject'`` or
+              ``'drop_newest'``. Default is ``'block'``.
+            * capacity (:obj:`int`, *optional*): Size of the ring buffer in
+              bytes. Default is 1 MiB.
+            * codec (:obj:`object`, *optional*): Object with ``encode(item)``
+              returning a bytes-like object or a tuple of them, which are
+              written back to back, and ``decode(data)`` returning the item.
+              Default is ``None`` which means :class:`PickleCodec`.
+            * context (:obj:`object`, *optional*): Multiprocessing context of
+              the lock and the semaphore. Default is ``None`` which means the
+              default context.
+        """
+        copies_items = True
+        coalesced = 0
+
+        def __init__(
+                self, maxsize=0, overflow='block', capacity=1 << 20,
+                codec=None, context=None):
+            if overflow not in ('block', 'reject', 'drop_newest'):
+                raise ValueError(
+                    'overflow policy \'{}\' is not supported'.format(
+                        overflow))
+            if context is None:
+                context = multiprocessing.get_context()
+            self.maxsize = maxsize
+            self.overflow = overflow
+            self.capacity = capacity
+            self.codec = codec if codec is not None else PickleCodec()
+            self._shm = shared_memory.SharedMemory(
+                create=True, size=_HEADER_SIZE + capacity)
+            self._lock = context.Lock()
+            self._ready = context.Semaphore(0)
+            self._is_owner = True
+            self._setup()
+
+        def _setup(self):
+            self._buf = self._shm.buf
+            self._ring = self._buf[_HEADER_SIZE:]
+            self._reserve = 0
+            self._reserve = _LENGTH.size + self._encode(None)[0]
+
+        def __del__(self):
+            # Views of the shared memory must be gone before it is closed
+            ring = getattr(self, '_ring', None)
+            if ring is not None:
+                ring.release()
+
+        def __getstate__(self):
+            return {
+                'maxsize': self.maxsize,
+                'overflow': self.overflow,
+                'capacity': self.capacity,
+                'codec': self.codec,
+                'name': self._shm.name,
+                'lock': self._lock,
+                'ready': self._ready}
+
+        def __setstate__(self, state):
+            self.maxsize = state['maxsize']
+            self.overflow = state['overflow']
+            self.capacity = state['capacity']
+            self.codec = state['codec']
+            self._shm = shared_memory.SharedMemory(state['name'])
+            self._lock = state['lock']
+            self._ready = state['ready']
+            self._is_owner = False
+            self._setup()
+
+        @property
+        def name(self):
+            """:obj:`str`: Name of the shared memory block."""
+            return self._shm.name
+
+        @property
+        def dropped(self):
+            """:obj:`int`: Number of items dropped by all producers."""
+            return self._field(_DROPPED)
+
+        def _field(self, index):
+            return _FIELD.unpack_from(self._buf, index * 8)[0]
+
+        def _set_field(self, index, value):
+            _FIELD.pack_into(self._buf, index * 8, value)
+
+        def _write(self, offset, data):
+            position = offset % self.capacity
+            end = position + len(data)
+            if end <= self.capacity:
+                self._ring[position:end] = data
+            else:
+                split = self.capacity - position
+                self._ring[position:] = data[:split]
+                self._ring[:end - self.capacity] = data[split:]
+
+        def _read(self, offset, size):
+            position = offset % self.capacity
+            end = position + size
+            if end <= self.capacity:
+                return self._ring[position:end]
+            return (bytes(self._ring[position:]) +
+                    bytes(self._ring[:end - self.capacity]))
+
+        def _encode(self, item):
+            chunks = self.codec.encode(item)
+            if not isinstance(chunks, tuple):
+                chunks = (chunks,)
+            size = sum(memoryview(chunk).nbytes for chunk in chunks)
+            reserve = 0 if item is None else self._reserve
+            if size + _LENGTH.size + reserve > self.capacity:
+                raise ValueError(
+                    'encoded item of {} bytes exceeds the queue '
+                    'capacity'.format(size))
+            return size, chunks, item is None
+
+        def _append(self, records, start):
+            # Write as many records as fit and return the index of the first
+            # record which was not written
+            with self._lock:
+                if self._field(_CLOSED):
+                    raise ValueError('queue is closed')
+                head = self._field(_HEAD)
+                tail = self._field(_TAIL)
+                count = self._field(_PUT) - self._field(_GOT)
+                index = start
+                while index < len(records):
+                    length, chunks, is_none = records[index]
+                    size = _LENGTH.size + length
+                    room = self.capacity - (tail - head)
+                    if is_none:
+                        # The termination request may use the reserved room
+                        if room < size:
+                            break
+                    elif room - self._reserve < size:
+                        break
+                    elif 0 < self.maxsize <= count:
+                        break
+                    self._write(tail, _LENGTH.pack(length))
+                    offset = tail + _LENGTH.size
+                    for chunk in chunks:
+                        chunk = memoryview(chunk).cast('B')
+                        self._write(offset, chunk)
+                        offset += len(chunk)
+                    tail += size
+                    count += 1
+                    index += 1
+                if index > start:
+                    # Publish the records before looking at the consumer
+                    self._set_field(_TAIL, tail)
+                    self._set_field(
+                        _PUT, self._field(_PUT) + index - start)
+                    if self._field(_WAITING):
+                        self._set_field(_WAITING, 0)
+                        self._ready.release()
+                return index
+
+        def _drop(self, count):
+            with self._lock:
+                self._set_field(_DROPPED, self._field(_DROPPED) + count)
+
+        def put(self, item, block=False, timeout=None, priority=0):
+            """Put an item and return a tuple of discarded items."""
+            try:
+                return tuple(self.put_many((item,), block, timeout))
+            except BufferError:
+                raise BufferError
+
+        def put_many(
+                self, items, block=False, timeout=None, priorities=None):
+            """Put items in order, encoded outside of the lock.
+
+            Records which fit are written under one lock acquisition. Returns
+            a list of discarded items. BufferError is raised with the number
+            of queued items and the list of discarded items as the arguments
+            when the queue is full.
+            """
+            if self._buf is None:
+                raise ValueError('queue is closed')
+            items = list(items)
+            records = [self._encode(item) for item in items]
+            endtime = _endtime(timeout)
+            index = 0
+            while True:
+                index = self._append(records, index)
+                if index == len(records):
+                    return []
+                if self.overflow == 'drop_newest':
+                    self._drop(len(records) - index)
+                    return items[index:]
+                if self.overflow == 'reject' or not block:
+                    raise BufferError(index, [])
+                remaining = _remaining(endtime)
+                if remaining is not None and remaining <= 0:
+                    raise BufferError(index, [])
+                time.sleep(_POLL)
+
+        def _take(self, max_items):
+            head = self._field(_HEAD)
+            tail = self._field(_TAIL)
+            items = []
+            while head < tail and len(items) < max_items:
+                size = _LENGTH.unpack(self._read(head, _LENGTH.size))[0]
+                data = self._read(head + _LENGTH.size, size)
+                try:
+                    items += [self.codec.decode(data)]
+                finally:
+                    if isinstance(data, memoryview):
+                        data.release()
+                head += _LENGTH.size + size
+            if items:
+                self._set_field(_GOT, self._field(_GOT) + len(items))
+                self._set_field(_HEAD, head)
+            return items
+
+        def get_many(self, max_items, block=True, timeout=None):
+            """Wait for an item and take up to *max_items* queued items."""
+            endtime = _endtime(timeout)
+            while True:
+                items = self._take(max_items)
+                if items:
+                    return items
+                if not block:
+                    raise queue.Empty
+                # Announce the wait and look again, a producer which missed
+                # the announcement has already published its records
+                self._set_field(_WAITING, 1)
+                items = self._take(max_items)
+                if items:
+                    return items
+                remaining = _remaining(endtime)
+                if remaining is not None and remaining <= 0:
+                    raise queue.Empty
+                self._ready.acquire(timeout=remaining)
+
+        def get(self, block=True, timeout=None):
+            return self.get_many(1, block, timeout)[0]
+
+        def task_done(self, count=1):
+            pass
+
+        def qsize(self):
+            return self._field(_PUT) - self._field(_GOT)
+
+        def empty(self):
+            return self._field(_HEAD) == self._field(_TAIL)
+
+        def clear(self):
+            """Remove all queued items and return them."""
+            items = []
+            if self._buf is None:
+                return items
+            while True:
+                taken = self._take(1 << 16)
+                if not taken:
+                    return items
+                items += taken
+
+        def close(self):
+            """Detach from the shared memory.
+
+            The process which created the queue also marks the queue closed
+            and destroys the shared memory. Producers which are attached keep
+            their mapping, but they can't put items anymore. Closing a closed
+            queue does nothing.
+            """
+            if self._buf is None:
+                return
+            if self._is_owner:
+                # Producers which are still attached see the flag
+                with self._lock:
+                    self._set_field(_CLOSED, 1)
+            self._ring.release()
+            self._buf = self._ring = None
+            self._shm.close()
+            if self._is_owner:
+                self._shm.unlink()
+
+    def shm_provider(capacity=1 << 20, codec=None, context=None):
+        """Create a provider with shared memory queues.
+
+        Tasks and timers are the ones of the ``std`` provider. Each state
+        machine gets a :class:`ShmQueue` which can be given to producer
+        processes through :attr:`pyeds.fsm.StateMachine.queue`.
+
+        Args:
+            * capacity (:obj:`int`, *optional*): Size of each ring buffer in
+              bytes. Default is 1 MiB.
+            * codec (:obj:`object`, *optional*): Codec of the queues. Default
+              is ``None`` which means :class:`PickleCodec`.
+            * context (:obj:`object`, *optional*): Multiprocessing context.
+              Default is ``None`` which means the default context.
+
+        Returns:
+            * :obj:`Provider`: A provider which can be registered in
+              ``providers``.
+        """
+        def make_queue(maxsize=0, overflow='block'):
+            return ShmQueue(maxsize, overflow, capacity, codec, context)
+
+        return Provider(
+            Task=StdTask,
+            Timer=StdTimer,
+            Lock=threading.Lock,
+            Queue=make_queue,
+            current=threading.current_thread,
+            Watcher=StdWatcher)
+
+    providers['shm'] = shm_provider()
+except ImportError:
+    pass
@@ -44,6 +44,10 @@ __author__ = 'Nenad Radulovic <nenad.b.radulovic@gmail.com>'
 
 import re
 import logging
+import os
+import pickle
+import threading
+import time
 
 from . import coordinator
 from . import lib
@@ -55,15 +59,30 @@ This string is prefixed with event name to form event handler name which will
 be called to process the event.
 '''
 
+# Queue priority of an urgent termination request, above any event priority
+_URGENT = float('inf')
+
+# State machine which is dispatching inline on this thread, see current()
+_inline = threading.local()
+
 
 class _PathManager:
-    def __init__(self):
+    """Compiled structure of a state machine class.
+
+    Everything here depends only on the declared state classes, so one
+    instance is built per state machine class and shared read-only by all
+    state machine instances of that class. Nodes are state classes.
+    """
+    def __init__(self, node_clss):
         self.depth = 0
+        self.node_clss = tuple(node_clss)
         self._hierarchy_map = {}
         self._path_map = {}
-        self._translation_map = {}
-        self._exit = []
-        self._enter = []
+        self._dispatch_map = {}
+        self._transition_map = {}
+        for node_cls in self.node_clss:
+            self._hierarchy_map[node_cls] = node_cls.super_state
+        self._build()
 
     def _build_node_cls_depth(self, node_cls):
         node_cls_depth = ()
@@ -75,60 +94,68 @@ class _PathManager:
 
         return node_cls_depth
 
-    def add_cls(self, node_cls, parent_node_cls):
-        self._hierarchy_map[node_cls] = parent_node_cls
-
-    def build(self):
-        # Build translation map
-        for node_cls in self._hierarchy_map.keys():
-            self._translation_map[node_cls] = node_cls()
+    def _build(self):
         # Build path map
-        for node_cls in self._hierarchy_map.keys():
+        for node_cls in self.node_clss:
             node_cls_depth = self._build_node_cls_depth(node_cls)
             self.depth = max(self.depth, len(node_cls_depth))
-            self._path_map[self.instance_of(node_cls)] = \
-                tuple([self.instance_of(i) for i in node_cls_depth] + [None])
+            self._path_map[node_cls] = node_cls_depth + (None,)
         # We don't need hierarchy map anymore
         del self._hierarchy_map
         # Ensure that there is at least None element in the dict so we don't
         # get KeyError elsewhere in the code
-        self._translation_map[None] = None
-        self._path_map[None] = [None]
+        self._path_map[None] = (None,)
         # Correction for hierarchy depth
         self.depth += 1
+        # Build dispatch map
+        event_names = set()
+        for node_cls in self.node_clss:
+            event_names.update(
+                name[len(EVENT_HANDLER_PREFIX):] for name in dir(node_cls)
+                if name.startswith(EVENT_HANDLER_PREFIX))
+        for node_cls in self.node_clss:
+            self._dispatch_map[node_cls] = self._build_dispatch(
+                node_cls, event_names)
+        # Names of events which have a handler in at least one node
+        self.event_names = frozenset(event_names)
+
+    def _build_dispatch(self, node_cls, event_names):
+        # Chain of nodes an event bubbles through, from node to the top node
+        chain = (node_cls,) + self._path_map[node_cls][:-1]
+        handlers = {}
+        for event_name in event_names:
+            handler_name = EVENT_HANDLER_PREFIX + event_name
+            for level, handler_node_cls in enumerate(chain):
+                if getattr(handler_node_cls, handler_name, None) is not None:
+                    handlers[event_name] = \
+                        (handler_node_cls, handler_name, chain[:level])
+                    break
+        # Event is not handled in the chain, the top node gets to decide
+        unhandled = (chain[-1], 'on_unhandled_event', chain[:-1])
+        return handlers, unhandled
 
     def states(self):
-        nodes = ()
-        for node in self._translation_map.values():
-            if node is not None:
-                nodes += (node.name,)
-        return nodes
-
-    def generate(self, source, destination):
+        return tuple(node_cls.__name__ for node_cls in self.node_clss)
+
+    def transition(self, source, destination):
+        # The paths depend only on the hierarchy which does not change after
+        # build, so the cache is bounded by the number of node pairs
+        paths = self._transition_map.get((source, destination))
+        if paths is not None:
+            return paths
         src_path = (source,) + self._path_map[source]
         dst_path = (destination,) + self._path_map[destination]
         intersection = set(src_path) & set(dst_path)
-        self._exit += [s for s in src_path if s not in intersection]
-        self._enter += [s for s in dst_path if s not in intersection]
-
-    def parent_of(self, node):
-        return self._path_map[node][0]
+        exit_path = tuple(s for s in src_path if s not in intersection)
+        enter_path = tuple(
+            s for s in reversed(dst_path) if s not in intersection)
+        paths = (exit_path, enter_path)
+        self._transition_map[(source, destination)] = paths
+        return paths
 
-    def instance_of(self, node_cls):
-        return self._translation_map[node_cls]
-
-    def pend_exit(self, node):
-        self._exit += [node]
-
-    def reset(self):
-        self._exit = []
-        self._enter = []
-
-    def exit_iterator(self):
-        return iter(self._exit)
-
-    def enter_iterator(self):
-        return reversed(self._enter)
+    def lookup(self, node_cls, event_name):
+        handlers, unhandled = self._dispatch_map[node_cls]
+        return handlers.get(event_name, unhandled)
 
 
 class Resource:
@@ -152,10 +179,21 @@ class Resource:
     Attributes:
         * resources (:obj:`dict`): Dictionary contains all resources managed by
           Resource. It contains additional information like *category* and
-          *name* for fast fetching of resource objects.
+          *name* for fast fetching of resource objects. Resources of the same
+          *category* and *name* are kept in a :obj:`dict` which is used as an
+          ordered set.
+
+    Note:
+        Modifications of resource management are serialized by a fixed set
+        of locks. A lock is chosen by hashing *category* and *name* of a
+        resource or by hashing the owner of a resource, so unrelated
+        resources do not contend for the same lock. Resources without an
+        owner are not indexed by owner. Lookups do not take any lock.
     """
+    __slots__ = ('category', 'name', 'owner', 'is_unique', '_releaser')
     resources = {}
-    _lock = None
+    _owners = {}
+    _locks = tuple(coordinator.provider.Lock() for _ in range(16))
 
     def __init__(
             self,
@@ -170,16 +208,32 @@ class Resource:
         self.owner = owner
         self.is_unique = is_unique
         self._releaser = releaser
-        Resource._lock = coordinator.provider.Lock()
 
     @classmethod
-    def _build_filter_map(cls):
-        filter_map = {}
-        for category, names in cls.resources.items():
-            for name, instances in names.items():
-                for instance in instances:
-                    filter_map[instance] = (category, name, instance.owner)
-        return filter_map
+    def _lock_of(cls, key):
+        return cls._locks[hash(key) % len(cls._locks)]
+
+    @classmethod
+    def _add_owned(cls, resource, owner):
+        # Resources without an owner are not indexed: nothing looks them up
+        # by owner and a shared bucket would serialize all their producers
+        if owner is None:
+            return
+        with cls._lock_of(owner):
+            cls._owners.setdefault(owner, {})[resource] = None
+
+    @classmethod
+    def _remove_owned(cls, resource, owner):
+        if owner is None:
+            return False
+        with cls._lock_of(owner):
+            owned = cls._owners.get(owner)
+            if owned is None or resource not in owned:
+                return False
+            del owned[resource]
+            if not owned:
+                del cls._owners[owner]
+        return True
 
     @classmethod
     def add_resource(cls, resource):
@@ -193,14 +247,15 @@ class Resource:
             * ValueError: When this resource is not a unique resource and
               *is_unique* is ``True``.
         """
-        with cls._lock:
-            if resource.category not in cls.resources:
-                cls.resources[resource.category] = {}
-            if resource.name not in cls.resources[resource.category]:
-                cls.resources[resource.category][resource.name] = []
-            cls.resources[resource.category][resource.name] += [resource]
-            instances = len(cls.resources[resource.category][resource.name])
-        if resource.is_unique and instances > 1:
+        # Category dictionaries are never deleted, so they can be created
+        # outside of the lock
+        names = cls.resources.setdefault(resource.category, {})
+        with cls._lock_of((resource.category, resource.name)):
+            instances = names.setdefault(resource.name, {})
+            instances[resource] = None
+            no_instances = len(instances)
+        cls._add_owned(resource, resource.owner)
+        if resource.is_unique and no_instances > 1:
             raise ValueError('{} is not unique resource'.format(resource.name))
 
     @classmethod
@@ -216,7 +271,7 @@ class Resource:
               that match *category* and *name* constraints.
         """
         try:
-            return cls.resources[category][name]
+            return list(cls.resources[category][name])
         except KeyError:
             return []
 
@@ -236,21 +291,50 @@ class Resource:
             * :obj:`list` of :obj:`Resource`: A list containing all resources
               that match *category*, *owner* and *name* constraints.
         """
+        if owner is not None:
+            # Owner index holds the smallest set of candidates
+            candidates = list(cls._owners.get(owner, ()))
+        elif category is not None and name is not None:
+            return cls.get_resources(category, name)
+        elif category is not None:
+            candidates = []
+            for instances in list(cls.resources.get(category, {}).values()):
+                candidates += instances
+        else:
+            candidates = []
+            for names in list(cls.resources.values()):
+                for instances in list(names.values()):
+                    candidates += instances
         retval = []
-        for instance, info in cls._build_filter_map().items():
-            i_category, i_name, i_owner = info
+        for instance in candidates:
             if category is not None:
-                if i_category != category:
-                    continue
-            if owner is not None:
-                if i_owner != owner:
+                if instance.category != category:
                     continue
             if name is not None:
-                if i_name != name:
+                if instance.name != name:
                     continue
             retval += [instance]
         return retval
 
+    @classmethod
+    def set_owner(cls, resource, owner):
+        """Change the owner of a resource.
+
+        A resource which is not registered to resource management will be
+        added to it with the new owner.
+
+        Args:
+            * resource (:obj:`Resource`): A resource which changes the owner.
+            * owner (:obj:`object`): Object which is the new owner of the
+              resource.
+        """
+        if cls._remove_owned(resource, resource.owner):
+            resource.owner = owner
+            cls._add_owned(resource, owner)
+        else:
+            resource.owner = owner
+            cls.add_resource(resource)
+
     @classmethod
     def remove_resource(cls, resource):
         """Remove a resource from resource management.
@@ -266,19 +350,17 @@ class Resource:
             * LookupError: When a resource is not registered to resource
               management.
         """
-        with cls._lock:
-            resources = cls.get_resources(resource.category, resource.name)
-            for idx, resource in enumerate(resources):
-                if resource is resource:
-                    if resource._releaser is not None:
-                        resource._releaser()
-                    del cls.resources[resource.category][resource.name][idx]
-                    if not cls.resources[resource.category][resource.name]:
-                        del cls.resources[resource.category][resource.name]
-                    if not cls.resources[resource.category]:
-                        del cls.resources[resource.category]
-                    return
-        raise LookupError('{} is not registered'.format(resource.name))
+        names = cls.resources.get(resource.category, {})
+        with cls._lock_of((resource.category, resource.name)):
+            instances = names.get(resource.name, {})
+            if resource not in instances:
+                raise LookupError('{} is not registered'.format(resource.name))
+            del instances[resource]
+            if not instances:
+                del names[resource.name]
+        cls._remove_owned(resource, resource.owner)
+        if resource._releaser is not None:
+            resource._releaser()
 
     @classmethod
     def remove_all_resources(cls, owner):
@@ -287,8 +369,149 @@ class Resource:
         Args:
             * owner (:obj:`object`): Object which is the owner of the resource.
         """
-        for resource in cls.filter_resources(owner=owner):
-            cls.remove_resource(resource)
+        owned = cls._owners.get(owner)
+        if not owned:
+            return
+        for resource in list(owned):
+            try:
+                cls.remove_resource(resource)
+            except LookupError:
+                # Removed in the meantime by somebody else
+                pass
+
+
+class _PassiveTask:
+    """Task and queue of a passive state machine.
+
+    Events are dispatched by the thread which sends an event while the state
+    machine is idle. Events sent while the state machine is dispatching, from
+    its own handlers or from other threads, are deferred in the buffer and
+    dispatched by that thread before it returns, so run-to-completion holds.
+    """
+    def __init__(self, sm, maxsize, overflow):
+        self.sm = sm
+        self.name = sm.name
+        self.buffer = coordinator.Buffer(maxsize, overflow)
+        self._lock = coordinator.provider.Lock()
+        self._is_started = False
+        self._is_dispatching = False
+
+    @property
+    def dropped(self):
+        return self.buffer.dropped
+
+    @property
+    def coalesced(self):
+        return self.buffer.coalesced
+
+    def _run(self, func, *args):
+        previous = getattr(_inline, 'sm', None)
+        _inline.sm = self.sm
+        try:
+            return func(*args)
+        finally:
+            _inline.sm = previous
+
+    def _dispatch_pending(self):
+        # The dispatching flag is cleared under the same lock which sees the
+        # buffer empty, so a concurrent put() either sees the flag cleared
+        # and dispatches by itself or its item is taken by this loop
+        sm = self.sm
+        error = None
+        while True:
+            with self._lock:
+                if not self.buffer:
+                    self._is_dispatching = False
+                    break
+                item = self.buffer.pop()
+            try:
+                is_running = sm.event_loop_step(item)
+            except Exception as e:
+                # Deferred events are still dispatched, the first error is
+                # raised to the sender afterwards
+                if error is None:
+                    error = e
+                else:
+                    sm.logger.exception('{} deferred event failed'.format(
+                        sm.name))
+                continue
+            except BaseException:
+                with self._lock:
+                    self._is_dispatching = False
+                raise
+            if not is_running:
+                with self._lock:
+                    self._is_started = False
+                    self._is_dispatching = False
+                break
+        if error is not None:
+            raise error
+
+    def _claim(self):
+        # Called with the lock held, is this thread going to dispatch?
+        if self._is_dispatching or not self._is_started:
+            return False
+        self._is_dispatching = True
+        return True
+
+    def start(self):
+        with self._lock:
+            self._is_started = True
+            self._is_dispatching = True
+        try:
+            self._run(self.sm.event_loop_start)
+        except BaseException:
+            with self._lock:
+                self._is_dispatching = False
+            raise
+        self._run(self._dispatch_pending)
+
+    def join(self, timeout=None):
+        pass
+
+    def is_alive(self):
+        return self._is_started
+
+    def put(self, item, block=False, timeout=None, priority=0):
+        with self._lock:
+            discarded = self.buffer.push(item, priority)
+            should_dispatch = self._claim()
+        if should_dispatch:
+            self._run(self._dispatch_pending)
+        return discarded
+
+    def put_many(self, items, block=False, timeout=None, priorities=None):
+        count = 0
+        discarded = []
+        if priorities is None:
+            priorities = [0] * len(items)
+        is_full = False
+        with self._lock:
+            for item, priority in zip(items, priorities):
+                try:
+                    discarded += self.buffer.push(item, priority)
+                except BufferError:
+                    is_full = True
+                    break
+                count += 1
+            should_dispatch = self._claim()
+        # Items which were queued are dispatched even when the rest did not
+        # fit
+        if should_dispatch:
+            self._run(self._dispatch_pending)
+        if is_full:
+            raise BufferError(count, discarded)
+        return discarded
+
+    def task_done(self, count=1):
+        pass
+
+    def qsize(self):
+        return len(self.buffer)
+
+    def clear(self):
+        with self._lock:
+            return self.buffer.clear()
 
 
 class StateMachine(Resource):
@@ -324,6 +547,39 @@ class StateMachine(Resource):
           machine. Default is to use ``logging.getLogger(None)``.
         * should_autostart (:obj:`bool`, *optional*): Should machine start at
           initialization? Default is ``True``.
+        * should_register_events (:obj:`bool`, *optional*): Should events
+          sent to this machine be added to resource management while they
+          are queued? When ``False`` the lifetime of an event is tied to the
+          machine queue and sending does not touch the global resource
+          registry. Default is ``True``.
+        * batch_size (:obj:`int`, *optional*): Maximum number of events the
+          event loop takes from the queue at once. The events are dispatched
+          back to back and the queue bookkeeping is done once per batch.
+          Default is 1 which means that events are taken one at a time.
+        * overflow (:obj:`str`, *optional*): What happens to an event sent
+          when the queue is full: ``'block'`` waits for room when the sender
+          is willing to block, ``'reject'`` raises ``BufferError``,
+          ``'drop_oldest'`` drops the oldest queued event, ``'drop_newest'``
+          drops the sent event and ``'coalesce'`` replaces the newest queued
+          event with the same name. Default is ``'block'``.
+        * expired_events (:obj:`dict`): Number of events dropped because their
+          deadline passed while they were queued, by event name.
+        * should_filter_events (:obj:`bool`, *optional*): Should events which
+          have no handler in any state of the machine be dropped when they are
+          sent? Such events would only reach ``on_unhandled_event``, so this
+          should not be used when a state relies on that handler. Default is
+          ``False``.
+        * filtered_events (:obj:`dict`): Number of events dropped when they
+          were sent because no state handles them, by event name.
+        * is_passive (:obj:`bool`, *optional*): Should the machine run on the
+          threads which use it instead of a task of the coordinator provider?
+          A passive machine dispatches an event on the thread which sends it,
+          before ``send()`` returns. An event sent while the machine is
+          dispatching, for example from one of its handlers, is deferred and
+          dispatched after the current event by the dispatching thread. The
+          queue size limits the number of deferred events and a full queue
+          never blocks. Timers of a passive machine dispatch their events on
+          the timer thread. Default is ``False``.
 
     Raises:
         * AttributeError: If this state machine has no states declared with
@@ -337,6 +593,11 @@ class StateMachine(Resource):
     init_state_cls = None
     logger = logging.getLogger(None)
     should_autostart = True
+    should_register_events = True
+    batch_size = 1
+    overflow = 'block'
+    should_filter_events = False
+    is_passive = False
 
     def __init__(self, queue_size=64, name=None):
         # Ensure that state machine has state classes
@@ -354,84 +615,101 @@ class StateMachine(Resource):
             name=name,
             is_unique=True,
             releaser=self.on_terminate)
-        self._queue = coordinator.provider.Queue(queue_size)
-        self._pm = _PathManager()
-        self._thread = coordinator.provider.Task(self.event_loop, self.name)
-        self._thread.sm = self
+        self.expired_events = {}
+        self.filtered_events = {}
+        self._compile()
+        self._states = None
+        if self.is_passive:
+            self._queue = self._thread = _PassiveTask(
+                self, queue_size, self.overflow)
+        else:
+            self._queue = coordinator.provider.Queue(
+                queue_size, self.overflow)
+            self._thread = coordinator.provider.Task(
+                self.event_loop, self.name, self._queue)
+            self._thread.sm = self
+            if getattr(self._queue, 'copies_items', False):
+                # The queue hands out copies, the sent events never come back
+                self.should_register_events = False
         if self.init_state_cls is None:
             self.init_state_cls = self.state_clss[0]
         if self.should_autostart:
             self._thread.start()
 
+    @classmethod
+    def _compile(cls):
+        # Look only into this class, subclasses get their own compilation
+        pm = cls.__dict__.get('_pm')
+        if pm is None:
+            pm = _PathManager(cls.state_clss)
+            cls._pm = pm
+        return pm
+
     def _setup_fsm(self):
-        class Signal(Event):
-            def execute(self, handler):
-                return handler()
-
-        # This will make the owner of these signals this state machine
-        self._ENTRY = Signal('entry')
-        self._EXIT = Signal('exit')
-        self._INIT = Signal('init')
-        for state_cls in self.state_clss:
-            self._pm.add_cls(state_cls, state_cls.super_state)
-        self._pm.build()
+        # Instantiate states, this will make the owner of states this state
+        # machine
+        self._states = {None: None}
+        for state_cls in self._pm.node_clss:
+            self._states[state_cls] = state_cls()
         # Set the state to initial state
-        self._state = self._pm.instance_of(self.init_state_cls)
+        self._state = self._states[self.init_state_cls]
         # Add itself to Resource
         Resource.add_resource(self)
         # Log info about state machine
         self.logger.debug('{} registered states {}'.format(
             self.name, self.states))
         self.logger.debug('{} hierarchy: {} level(s) deep, {} state(s)'.format(
-            self.name, self._pm.depth, len(self._pm.states())))
+            self.name, self._pm.depth, len(self._pm.node_clss)))
         self.logger.info('{} {} is initial state'.format(
             self.name, self._state.name))
 
-    def _exec_state(self, state, event):
-        handler_name = '{}{}'.format(EVENT_HANDLER_PREFIX, event.name)
-        try:
-            super_state = None
-            handler = getattr(state, handler_name)
-        except AttributeError:
-            super_state = self._pm.parent_of(state)
-            handler = state.on_unhandled_event
+    def _exec_state(self, state, handler, event):
         try:
             new_state_cls = event.execute(handler)
         except Exception as e:
             self.on_exception(e, state, event, 'State exception')
             # This state has caused an error, no transitions will be done
             new_state_cls = None
-        new_state = self._pm.instance_of(new_state_cls)
-        return new_state, super_state
+        return new_state_cls
 
     def _dispatch(self, event):
         self.logger.debug('{} {}({})'.format(
             self.name, self._state.name, event.name))
-        current_state = self._state
-        self._pm.reset()
-        # Loop until we find a state that will handle the event
-        while True:
-            new_state, super_state = self._exec_state(current_state, event)
-            if super_state is not None:
-                self._pm.pend_exit(current_state)
-                current_state = super_state
-            else:
-                break
+        states = self._states
+        # Find the state that will handle the event, all states below it have
+        # not handled it
+        current_state_cls, handler_name, bubbled = \
+            self._pm.lookup(self._state.__class__, event.name)
+        for state_cls in bubbled:
+            state = states[state_cls]
+            self._exec_state(state, state.on_unhandled_event, event)
+        current_state = states[current_state_cls]
+        new_state_cls = self._exec_state(
+            current_state, getattr(current_state, handler_name), event)
         # Loop while new transitions are needed
-        while new_state is not None:
+        while new_state_cls is not None:
+            new_state = states[new_state_cls]
             self.logger.debug('{} {} -> {}'.format(
                 self.name, current_state.name, new_state.name))
-            self._pm.generate(current_state, new_state)
+            exit_path, enter_path = self._pm.transition(
+                current_state_cls, new_state_cls)
+            # States the event has bubbled through are exited first
+            if bubbled:
+                exit_path = bubbled + exit_path
+                bubbled = ()
             # Exit the path
-            for exit_state in self._pm.exit_iterator():
-                self._exec_state(exit_state, self._EXIT)
+            for exit_state_cls in exit_path:
+                exit_state = states[exit_state_cls]
+                self._exec_state(exit_state, exit_state.on_exit, _EXIT)
                 Resource.remove_all_resources(exit_state)
             # Enter the path
-            for enter_state in self._pm.enter_iterator():
-                self._exec_state(enter_state, self._ENTRY)
-            self._pm.reset()
+            for enter_state_cls in enter_path:
+                enter_state = states[enter_state_cls]
+                self._exec_state(enter_state, enter_state.on_entry, _ENTRY)
+            current_state_cls = new_state_cls
             current_state = new_state
-            new_state, _ = self._exec_state(current_state, self._INIT)
+            new_state_cls = self._exec_state(
+                current_state, current_state.on_init, _INIT)
             self._state = current_state
 
     @property
@@ -452,6 +730,26 @@ class StateMachine(Resource):
         """
         return self._state
 
+    @property
+    def queue(self):
+        """:obj:`Queue`: Event queue of the state machine. A queue of the
+        ``shm`` provider can be given to producer processes, which put events
+        directly into it.
+        """
+        return self._queue
+
+    @property
+    def dropped_events(self):
+        """:obj:`int`: Number of events dropped because the queue was full
+        """
+        return self._queue.dropped
+
+    @property
+    def coalesced_events(self):
+        """:obj:`int`: Number of queued events replaced by a newer event
+        """
+        return self._queue.coalesced
+
     def instance_of(self, state_cls):
         """Get the instance of state class
 
@@ -466,7 +764,7 @@ class StateMachine(Resource):
               state machine.
         """
         try:
-            return self._pm.instance_of(state_cls)
+            return self._states[state_cls]
         except KeyError:
             raise LookupError(
                 'State \'{!r}\' is not a registered state'.format(state_cls))
@@ -474,37 +772,112 @@ class StateMachine(Resource):
     def event_loop(self):
         """Event loop
 
-        This method executes the event looper.
+        This method executes the event looper. It is run by tasks of
+        coordinator providers which dedicate a thread of execution to each
+        state machine.
 
         Raises:
             * LookupError: If a state returns invalid transition class.
         """
-        # Initialize the states and build hierarchy
+        self.event_loop_start()
+        if self.batch_size > 1:
+            while self._event_loop_batch(
+                    self._queue.get_many(self.batch_size)):
+                pass
+        else:
+            while self.event_loop_step(self._queue.get()):
+                pass
+
+    def event_loop_start(self):
+        """Start the event loop.
+
+        Initialize the states, execute initial transition and call
+        ``on_start()``. Coordinator providers which share threads of execution
+        between state machines call this method once before feeding the queued
+        items to :meth:`event_loop_step`.
+        """
         self._setup_fsm()
-        self._dispatch(self._INIT)
+        self._dispatch(_INIT)
         self.on_start()
-        # Execute event loop
-        while True:
-            event = self._queue.get()
-            # Check should we exit
-            if event is None:
-                self._queue.task_done()
-                Resource.remove_all_resources(self)
-                Resource.remove_resource(self)
-                self.logger.info('{} terminated'.format(self.name))
-                return
-            self._dispatch(event)
-            try:
-                Resource.remove_resource(event)
-            except LookupError:
-                pass
-            self._queue.task_done()
 
-    def send(self, event, block=True, timeout=None):
+    def event_loop_step(self, event):
+        """Process one item taken from the event queue.
+
+        Args:
+            * event (:obj:`Event`): Event taken from the queue or ``None``
+              which signals termination.
+
+        Returns:
+            * :obj:`bool`: ``False`` when the state machine has terminated,
+              ``True`` otherwise.
+
+        Raises:
+            * LookupError: If a state returns invalid transition class.
+        """
+        # Check should we exit
+        if event is None:
+            self._queue.task_done()
+            self._terminate()
+            return False
+        deadline = event.deadline
+        if deadline is not None and deadline < time.monotonic():
+            self._expire(event)
+        else:
+            self._dispatch(event)
+        if event.payload is not None:
+            event.release_payload()
+        if self.should_register_events:
+            self._release_events((event,))
+        self._queue.task_done()
+        return True
+
+    def _event_loop_batch(self, events):
+        should_continue = True
+        count = len(events)
+        for idx, event in enumerate(events):
+            if event is None:
+                # Events taken after the termination request are discarded
+                # together with the ones left in the queue
+                should_continue = False
+                discarded = events[idx + 1:]
+                events = events[:idx]
+                break
+            deadline = event.deadline
+            if deadline is not None and deadline < time.monotonic():
+                self._expire(event)
+            else:
+                self._dispatch(event)
+            if event.payload is not None:
+                event.release_payload()
+        if self.should_register_events:
+            self._release_events(events)
+        self._queue.task_done(count)
+        if not should_continue:
+            self._terminate(discarded)
+        return should_continue
+
+    def _expire(self, event):
+        self.expired_events[event.name] = \
+            self.expired_events.get(event.name, 0) + 1
+        self.on_expired_event(event)
+
+    def _terminate(self, discarded=()):
+        # Events queued after the termination request are never dispatched
+        self._discard_events(list(discarded) + self._queue.clear())
+        Resource.remove_all_resources(self)
+        Resource.remove_resource(self)
+        # Queues which hold system resources, like shared memory, are closed
+        close = getattr(self._queue, 'close', None)
+        if close is not None:
+            close()
+        self.logger.info('{} terminated'.format(self.name))
+
+    def send(self, event, block=True, timeout=None, priority=None):
         """Send an event to the state machine.
 
         The event is put to state machine queue and then the event_loop()
-        method will process the queued event.
+        method will process the queued event. When *should_filter_events* is
+        set an event which no state handles is dropped instead.
 
         Args:
             * event (:obj:`Event`): Event object to send to this machine.
@@ -515,13 +888,199 @@ class StateMachine(Resource):
               wait up to *timeout* seconds. This argument is disregarded when
               *block* is ``False``. Default is ``None`` which means to block
               indefinitely.
+            * priority (:obj:`int`, *optional*): Priority of the event in the
+              queue. Default is ``None`` which means to use the priority of
+              the event class.
 
         Raises:
             * BufferError: Raised when queue buffer is full and timeout has
               passed (if given), otherwise, it raises it immediately when full.
+              Blocking and raising depend on the *overflow* attribute.
+        """
+        if self.should_filter_events and self._is_filtered(event):
+            return
+        if priority is None:
+            priority = event.priority
+        if not self.should_register_events:
+            discarded = self._queue.put(event, block, timeout, priority)
+        else:
+            Resource.add_resource(event)
+            try:
+                discarded = self._queue.put(event, block, timeout, priority)
+            except BufferError:
+                Resource.remove_resource(event)
+                raise
+        if discarded:
+            self._discard_events(discarded)
+
+    def _is_filtered(self, event):
+        if event.name in self._pm.event_names:
+            return False
+        self.filtered_events[event.name] = \
+            self.filtered_events.get(event.name, 0) + 1
+        return True
+
+    @staticmethod
+    def _release_events(events):
+        for event in events:
+            try:
+                Resource.remove_resource(event)
+            except LookupError:
+                pass
+
+    def _discard_events(self, events):
+        # Events dropped or replaced in the queue are finished without being
+        # dispatched, their payloads are released like the dispatched ones
+        events = [event for event in events if event is not None]
+        for event in events:
+            if event.payload is not None:
+                event.release_payload()
+        if self.should_register_events:
+            self._release_events(events)
+
+    def send_many(self, events, block=True, timeout=None, priority=None):
+        """Send a sequence of events to the state machine.
+
+        All events are put to the state machine queue in one queue operation,
+        in the order in which they are given.
+
+        Args:
+            * events (:obj:`iterable` of :obj:`Event`): Events to send to this
+              machine.
+            * block (:obj:`bool`, *optional*): If event queue is full should
+              this method block? Default is ``True`` which means the method
+              will block.
+            * timeout (:obj:`float`, *optional*): If *block* is ``True`` then
+              wait up to *timeout* seconds. Default is ``None`` which means to
+              block indefinitely.
+            * priority (:obj:`int`, *optional*): Priority of the events in the
+              queue. Default is ``None`` which means to use the priority of
+              each event class.
+
+        Raises:
+            * BufferError: Raised when queue buffer is full. The first
+              argument of the exception is the number of events which were
+              put to the queue, not counting the filtered events.
+        """
+        if self.should_filter_events:
+            events = [
+                event for event in events if not self._is_filtered(event)]
+        else:
+            events = list(events)
+        if priority is None:
+            priorities = [event.priority for event in events]
+        else:
+            priorities = [priority] * len(events)
+        if self.should_register_events:
+            for event in events:
+                Resource.add_resource(event)
+        try:
+            discarded = self._queue.put_many(
+                events, block, timeout, priorities)
+        except BufferError as exc:
+            count, discarded = exc.args
+            self._discard_events(discarded)
+            # Events which were not put stay with the caller
+            if self.should_register_events:
+                self._release_events(events[count:])
+            raise
+        if discarded:
+            self._discard_events(discarded)
+
+    def _send_timer_events(self, events):
+        # Timer handlers may share a thread, so never block it
+        try:
+            self.send_many(events, block=False)
+        except BufferError as exc:
+            if self.should_filter_events:
+                events = [
+                    event for event in events
+                    if event.name in self._pm.event_names]
+            for event in events[exc.args[0]:]:
+                self.logger.warning('{} {} dropped, queue is full'.format(
+                    self.name, event.name))
+
+    @classmethod
+    def broadcast(
+            cls,
+            event,
+            state_machines=None,
+            block=True,
+            timeout=None,
+            priority=None):
+        """Send one event to many state machines.
+
+        The same event instance is put to the queue of every state machine.
+        The event is not added to resource management, so it should not be
+        modified by the state machines.
+
+        Args:
+            * event (:obj:`Event`): Event object to send.
+            * state_machines (:obj:`iterable` of :obj:`StateMachine`,
+              *optional*): State machines which receive the event, for
+              example the ones returned by
+              :meth:`Resource.filter_resources`. Default is ``None`` which
+              means all running state machines which are instances of this
+              class.
+            * block (:obj:`bool`, *optional*): If an event queue is full
+              should this method block? Default is ``True``.
+            * timeout (:obj:`float`, *optional*): If *block* is ``True`` then
+              wait up to *timeout* seconds for each state machine. Default is
+              ``None`` which means to block indefinitely.
+            * priority (:obj:`int`, *optional*): Priority of the event in the
+              queues. Default is ``None`` which means to use the priority of
+              the event class.
+
+        Returns:
+            * :obj:`list` of :obj:`StateMachine`: State machines which did not
+              receive the event because their queue was full.
+
+        Raises:
+            * ValueError: When the event has a payload, since the first state
+              machine which finishes the event releases the payload.
+        """
+        if event.payload is not None:
+            raise ValueError('an event with a payload can not be broadcast')
+        if state_machines is None:
+            state_machines = [
+                sm for sm in Resource.filter_resources(
+                    category='state machine')
+                if isinstance(sm, cls)]
+        if priority is None:
+            priority = event.priority
+        missed = []
+        for sm in state_machines:
+            if sm.should_filter_events and sm._is_filtered(event):
+                continue
+            try:
+                discarded = sm._queue.put(event, block, timeout, priority)
+            except BufferError:
+                missed += [sm]
+                continue
+            if discarded:
+                sm._discard_events(discarded)
+        return missed
+
+    def dispatch(self, event):
+        """Dispatch an event on the caller's thread.
+
+        This is the fast path of a passive state machine: the event is not
+        filtered nor added to resource management. The event is dispatched
+        before this method returns, unless the machine is already
+        dispatching in which case the event is deferred.
+
+        Args:
+            * event (:obj:`Event`): Event object to dispatch.
+
+        Raises:
+            * RuntimeError: When the state machine is not passive.
+            * BufferError: When the event is deferred and the queue is full.
         """
-        Resource.add_resource(event)
-        self._queue.put(event, block, timeout)
+        if not self.is_passive:
+            raise RuntimeError('{} is not passive'.format(self.name))
+        discarded = self._queue.put(event, priority=event.priority)
+        if discarded:
+            self._discard_events(discarded)
 
     def wait(self, timeout=None):
         """Wait until the state machine terminates.
@@ -530,8 +1089,13 @@ class StateMachine(Resource):
             * timeout (:obj:`float`, *optional*): How many seconds to wait for
               termination. The default is ``None`` which means to wait
               indefinitely.
+
+        Returns:
+            * :obj:`None`: For most coordinator providers.
+            * awaitable: When using the asyncio provider and this method is
+              called from the event loop. Await it to wait for termination.
         """
-        self._thread.join(timeout)
+        return self._thread.join(timeout)
 
     def do_start(self):
         """Explicitly start the state machine
@@ -542,26 +1106,26 @@ class StateMachine(Resource):
         """
         self._thread.start()
 
-    def do_terminate(self, timeout=None):
+    def do_terminate(self, timeout=None, is_urgent=False):
         """Pend termination of the state machine.
 
         Put a special event into to queue buffer which will signal the state
-        machine to terminate.
+        machine to terminate. The queue accepts the termination request even
+        when it is full.
 
         Args:
-            * timeout (:obj:`float`, *optional*): When specified it will wait
-              up to *timeout* seconds. Default is ``None`` which means to block
-              indefinitely.
-
-        Raises:
-            * BufferError: Raised when queue buffer is full and timeout has
-              passed (if given), otherwise, it raises it immediately when full.
+            * timeout (:obj:`float`, *optional*): Not used, the argument is
+              kept for compatibility.
+            * is_urgent (:obj:`bool`, *optional*): When ``True`` the request
+              is put in front of all queued events, which are then discarded.
+              Default is ``False`` which means that the request is queued
+              like an event with priority 0.
 
         Note:
             After calling this method the state machine may still run. Use
             ``wait()`` to wait for state machine until it terminates.
         """
-        self._queue.put(None, timeout=timeout)
+        self._queue.put(None, priority=_URGENT if is_urgent else 0)
 
     def on_start(self):
         """Gets called by state machine just before the machine starts"""
@@ -571,6 +1135,14 @@ class StateMachine(Resource):
         """Gets called by state machine just before the termination"""
         pass
 
+    def on_expired_event(self, event):
+        """Gets called when an expired event is dropped instead of dispatched
+
+        Args:
+            * event (:obj:`Event`): Event whose deadline has passed.
+        """
+        self.logger.debug('{} {} expired'.format(self.name, event.name))
+
     def on_exception(self, exc, state, event, msg):
         """Gets called when un-handled state exception has occurred
 
@@ -658,7 +1230,7 @@ class State(Resource):
             * resource (:obj:`Resource`): Resource which will be local to this
               state.
         """
-        resource.owner = self
+        Resource.set_owner(resource, self)
 
     def on_entry(self):
         """State "entry" event handler
@@ -744,6 +1316,9 @@ class DeclareState(object):
         except AttributeError:
             # Add new attribute if it doesn't exist
             self.state_machine_cls.state_clss = [state_cls]
+        # Compiled structure of the state machine class is now outdated
+        if '_pm' in self.state_machine_cls.__dict__:
+            del self.state_machine_cls._pm
         return state_cls
 
 
@@ -773,16 +1348,173 @@ class Event(lib.Immutable, Resource):
         * Owner of event: state machine which generated this event or ``None``
           if the event was generated outside a state machine context.
 
+    Fixed fields of an event are stored in slots. Additional parameters can
+    still be set as attributes, the attribute dictionary is only allocated
+    when the first one is set. A derived event class may declare its
+    parameters in ``__slots__`` to avoid the dictionary altogether::
+
+        class AxisButtonPress(fsm.Event):
+            __slots__ = ('direction',)
+
     Args:
         * name (:obj:`str`, *optional*): Name of the event. When not given the
           event will take the name of the derived Event class and convert it to
           appropriate format.
+        * ttl (:obj:`float`, *optional*): Time to live of the event in seconds.
+          When the event is still queued after this time the state machine
+          drops it instead of dispatching it. Default is ``None`` which means
+          to use the *ttl* attribute of the event class.
+        * payload (:obj:`object`, *optional*): Binary data of the event, any
+          object which supports the buffer protocol. Default is ``None``.
+
+    Attributes:
+        * payload (:obj:`memoryview`): View of the binary data of the event or
+          ``None``. The data is not copied when the event is sent or queued.
+          The view is released when the state machine has finished the event,
+          a handler which needs the data later has to copy it.
+        * deadline (:obj:`float`): The ``time.monotonic()`` time after which
+          the event is dropped, or ``None`` when the event does not expire.
+        * ttl (:obj:`float`): Default time to live of events of this class.
+          Default is ``None`` which means that the events do not expire.
+        * priority (:obj:`int`): Priority of events of this class in the queue
+          of a state machine. Events with a higher priority are dispatched
+          first, events with the same priority are dispatched in the order in
+          which they were sent. Default is 0.
+        * is_coalescible (:obj:`bool`): When ``True`` an event of this class
+          does not queue up behind a queued event with the same
+          :meth:`coalesce_key`, instead it takes the place of that event, see
+          :meth:`merge`. Default is ``False``.
     """
+    __slots__ = ('timer', 'deadline', 'payload', '__dict__')
+    ttl = None
+    priority = 0
+    is_coalescible = False
     _ename_regex = re.compile('((?<=[a-z0-9])[A-Z]|(?!^)[A-Z](?=[a-z]))')
+    _names = {}
+    _shared = {}
+    _params = {}
+
+    def __init__(self, name=None, ttl=None, payload=None):
+        if not name:
+            cls = self.__class__
+            name = Event._names.get(cls)
+            if name is None:
+                name = self.format_name(cls.__name__)
+                Event._names[cls] = name
+        # Fixed fields are set directly, immutability is enforced for any
+        # later assignment
+        init = object.__setattr__
+        init(self, 'category', 'event')
+        init(self, 'name', name)
+        init(self, 'owner', current())
+        init(self, 'is_unique', False)
+        init(self, '_releaser', None)
+        if ttl is None:
+            ttl = self.ttl
+        init(self, 'deadline', None if ttl is None else time.monotonic() + ttl)
+        init(self, 'payload', None if payload is None else memoryview(payload))
+
+    @classmethod
+    def shared(cls, name=None):
+        """Get a shared instance of an event without parameters.
 
-    def __init__(self, name=None):
-        name = name or self.format_name(self.__class__.__name__)
-        super().__init__(category='event', name=name, owner=current())
+        The first call for a given event class and *name* creates the event,
+        all following calls return the same instance. Sending a shared event
+        does not allocate anything, which makes it suitable for frequent
+        signals. The shared event has no owner, never expires and must not be
+        given any parameters since all receivers see the same object.
+
+        Args:
+            * name (:obj:`str`, *optional*): Name of the event. When not given
+              the event will take the name of the event class.
+
+        Returns:
+            * :obj:`Event`: The shared event instance.
+        """
+        event = Event._shared.get((cls, name))
+        if event is None:
+            event = cls.__new__(cls)
+            Event.__init__(event, name)
+            # Shared events belong to nobody and never expire
+            object.__setattr__(event, 'owner', None)
+            object.__setattr__(event, 'deadline', None)
+            event = Event._shared.setdefault((cls, name), event)
+        return event
+
+    def coalesce_key(self):
+        """Get the key of a coalescible event.
+
+        Two queued coalescible events with equal keys are merged into one.
+        Override this method to coalesce events by their parameters.
+
+        Returns:
+            * :obj:`object`: Hashable key, by default the event name.
+        """
+        return self.name
+
+    def merge(self, pending):
+        """Merge this event with the pending event which has the same key.
+
+        The returned event replaces the pending event in the queue and keeps
+        its position. By default the latest event wins.
+
+        Args:
+            * pending (:obj:`Event`): The queued event.
+
+        Returns:
+            * :obj:`Event`: The event which stays in the queue.
+        """
+        return self
+
+    def release_payload(self):
+        """Release the view of the payload.
+
+        The state machine calls this method when it has finished the event.
+        The payload can't be accessed through the event afterwards. The view
+        stays valid when something still uses its buffer, until that is
+        released too.
+        """
+        payload = self.payload
+        if payload is not None:
+            try:
+                payload.release()
+            except BufferError:
+                pass
+
+    def __reduce_ex__(self, protocol):
+        # Only the name, the deadline, the payload and the parameters are
+        # serialized, the owner and the timer belong to the sending process.
+        # Since protocol 5 the payload is not copied into the pickle, it may
+        # be given to the pickler as an out-of-band buffer
+        cls = self.__class__
+        names = Event._params.get(cls)
+        if names is None:
+            names = ()
+            for klass in cls.__mro__:
+                if klass is Event or not issubclass(klass, Event):
+                    continue
+                slots = klass.__dict__.get('__slots__', ())
+                if isinstance(slots, str):
+                    slots = (slots,)
+                names += tuple(
+                    name for name in slots
+                    if name not in ('__dict__', '__weakref__'))
+            Event._params[cls] = names
+        params = {
+            name: getattr(self, name) for name in names
+            if hasattr(self, name)}
+        payload = self.payload
+        if payload is None:
+            args = (cls, self.name, self.deadline)
+        elif protocol >= 5:
+            args = (
+                cls, self.name, self.deadline, pickle.PickleBuffer(payload))
+        else:
+            args = (cls, self.name, self.deadline, payload.tobytes())
+        state = getattr(self, '__dict__', None)
+        if not state and not params:
+            return (_restore_event, args)
+        return (_restore_event, args, (state or None, params))
 
     def format_name(self, name):
         """Resource, format the name.
@@ -826,7 +1558,10 @@ class Event(lib.Immutable, Resource):
               who created this event. This argument is invalid in case when the
               owner of event is not a state machine.
             * state_machine (:obj:`StateMachine`): State machine object.
-            * state_machine (:obj:`str`): State machine name.
+            * state_machine (:obj:`str`): State machine name. When there is
+              no state machine with that name in this process and a
+              :class:`pyeds.shard.ShardPool` is running, the event is routed
+              to the process which executes the state machine.
             * state_machine (:obj:`Channel`): Event channel.
 
         Raises:
@@ -839,14 +1574,30 @@ class Event(lib.Immutable, Resource):
         elif isinstance(state_machine, StateMachine):
             state_machine.send(self)
         elif isinstance(state_machine, str):
-            state_machine = Resource.get_resources(
-                'state_machine', state_machine)
-            state_machine.send(self)
+            state_machines = Resource.get_resources(
+                'state machine', state_machine)
+            if state_machines:
+                state_machines[0].send(self)
+                return
+            from . import shard
+            if shard.router is None:
+                raise LookupError(
+                    'state machine {!r} does not exist'.format(state_machine))
+            shard.router.send(state_machine, self)
         else:
             raise ValueError('state_machine arg {!r} is invalid'.format(
                 state_machine))
 
 
+def _restore_event(cls, name, deadline, payload=None):
+    event = cls.__new__(cls)
+    Event.__init__(event, name, payload=payload)
+    # Restored events belong to nobody
+    object.__setattr__(event, 'owner', None)
+    object.__setattr__(event, 'deadline', deadline)
+    return event
+
+
 class After(Resource):
     """Send an event to current state machine after a specified number of
     seconds.
@@ -854,9 +1605,23 @@ class After(Resource):
     This is a timer object that will send the specified event after period of
     elapsed time. The timer will start counting at the time of creation.
 
+    A running timer is registered to resource management, so it is cancelled
+    when the state machine terminates, or when the state is exited if it was
+    made local with :meth:`State.set_local`. The timer is released when it
+    expires or when it is cancelled.
+
     Args:
         * after (:obj:`float`): Time period in seconds.
         * event_name (:obj:`str`): Name of event.
+        * shared_event (:obj:`bool`, *optional*): When ``True`` the timer
+          creates its event once and sends the same instance on every
+          expiry. Handlers must then not give the event any parameters.
+          Default is ``False`` which means a new event is created on each
+          expiry.
+        * slack (:obj:`float`, *optional*): How many seconds the expiry may
+          be delayed. Timers which allow some slack can be expired together
+          with other timers, which reduces the number of wake-ups. Default
+          is 0.
 
     Example:
         In order to send the event called 'blink' to itself after 10 seconds
@@ -865,25 +1630,47 @@ class After(Resource):
             fsm.After(10.0, 'blink')
     """
 
-    def __init__(self, after, event_name):
+    def __init__(self, after, event_name, shared_event=False, slack=0.0):
         name = '{}.{}.{}'.format(self.__class__.__name__, event_name, after)
         # Setup resource instance
+        sm = current()
         super().__init__(
             category='timer',
             name=name,
-            owner=current(),
-            releaser=self.cancel)
+            owner=sm,
+            releaser=self._stop)
         # Save arguments
+        self.sm = sm
         self.timeo = after
         self.event_name = event_name
+        self.shared_event = shared_event
+        self.slack = slack
+        self._event = None
         self.start()
 
+    def _send(self):
+        event = self._event
+        if event is None:
+            event = Event(self.event_name)
+            event.timer = self
+            if self.shared_event:
+                self._event = event
+        # Events of timers expired together are sent to a state machine in
+        # one batch
+        coordinator.deliver(self.sm._send_timer_events, event)
+
+    def _release(self):
+        try:
+            Resource.remove_resource(self)
+        except LookupError:
+            # Expired or released in the meantime
+            pass
+
     def handler(self):
         """Timeout handler method.
         """
-        event = Event(self.event_name)
-        event.timer = self
-        self.owner.send(event)
+        self._release()
+        self._send()
 
     def start(self):
         """Start the timer.
@@ -891,13 +1678,19 @@ class After(Resource):
         Use this method to start a cancelled timer or a timer that has been
         expired.
         """
-        self._timer = coordinator.provider.Timer(self.timeo, self.handler)
+        Resource.add_resource(self)
+        self._timer = coordinator.provider.Timer(
+            self.timeo, self.handler, self.slack)
         self._timer.start()
 
+    def _stop(self):
+        self._timer.cancel()
+
     def cancel(self):
         """Cancel a running timer
         """
-        self._timer.cancel()
+        self._stop()
+        self._release()
 
 
 class Every(After):
@@ -907,9 +1700,35 @@ class Every(After):
     This is a timer object that will send the specified event every period of
     elapsed time. The timer will start counting at the time of creation.
 
+    Expiries are scheduled against absolute deadlines which are multiples of
+    the period from the start of the timer, so the time spent in handling an
+    expiry does not accumulate. When an expiry is late by one or more periods,
+    the *missed* policy decides what to send:
+
+        * ``'catch_up'``: send an event for each elapsed period.
+        * ``'coalesce'``: send a single event for all elapsed periods.
+        * ``'skip'``: send nothing, wait for the next deadline.
+
+    In all cases the following deadline stays on the original schedule.
+
     Args:
         * every (:obj:`float`): Time period in seconds.
         * event_name (:obj:`str`): Name of event.
+        * shared_event (:obj:`bool`, *optional*): When ``True`` the same
+          event instance is sent on every expiry. Default is ``False``.
+        * missed (:obj:`str`, *optional*): Policy for missed periods. Default
+          is ``'coalesce'``.
+        * slack (:obj:`float`, *optional*): How many seconds an expiry may be
+          delayed. Default is 0.
+
+    Attributes:
+        * lateness (:obj:`lib.RunningStats`): Statistics of expiry lateness
+          in seconds.
+        * missed_ticks (:obj:`int`): Number of periods which have not been
+          sent as separate events.
+
+    Raises:
+        * ValueError: When *missed* is not a known policy.
 
     Example:
         In order to send the event called 'blink' to itself every 10 seconds
@@ -917,16 +1736,199 @@ class Every(After):
 
             fsm.Every(10.0, 'blink')
     """
+    MISSED_POLICIES = ('catch_up', 'coalesce', 'skip')
+
+    def __init__(self, every, event_name, shared_event=False,
+                 missed='coalesce', slack=0.0):
+        if missed not in self.MISSED_POLICIES:
+            raise ValueError('missed arg {!r} is invalid'.format(missed))
+        self.missed = missed
+        self.lateness = lib.RunningStats()
+        self.missed_ticks = 0
+        self._lock = coordinator.provider.Lock()
+        self._is_running = False
+        super().__init__(every, event_name, shared_event, slack)
 
-    def __init__(self, every, event_name):
-        super().__init__(every, event_name)
+    @property
+    def jitter(self):
+        """:obj:`float`: Standard deviation of expiry lateness in seconds
+        """
+        return self.lateness.stdev
+
+    def _arm(self):
+        timeout = max(0.0, self._deadline - time.monotonic())
+        self._timer = coordinator.provider.Timer(
+            timeout, self.handler, self.slack)
+        self._timer.start()
 
     def handler(self):
         """Timeout handler method.
         """
-        super().handler()
+        with self._lock:
+            if not self._is_running:
+                return
+            lateness = time.monotonic() - self._deadline
+            missed = int(lateness // self.timeo)
+            self._deadline += (missed + 1) * self.timeo
+            self._arm()
+        self.lateness.update(lateness)
+        if self.missed == 'catch_up':
+            count = missed + 1
+        elif self.missed == 'coalesce' or not missed:
+            count = 1
+        else:
+            count = 0
+        self.missed_ticks += missed + 1 - count
+        for _ in range(count):
+            self._send()
+
+    def start(self):
+        """Start the timer.
+
+        Use this method to start a cancelled timer. The deadlines are counted
+        from the time of this call.
+        """
+        Resource.add_resource(self)
+        with self._lock:
+            self._is_running = True
+            self._deadline = time.monotonic() + self.timeo
+            self._arm()
+
+    def _stop(self):
+        with self._lock:
+            self._is_running = False
+            self._timer.cancel()
+
+
+class Watch(Resource):
+    """Send an event to current state machine when a file object is ready.
+
+    Sockets, pipes and other file objects are watched by the coordinator
+    provider, no thread is needed per file object.
+
+    When *read_size* is given the watch reads up to that many bytes each time
+    the file object is readable and sends them as the payload of the event,
+    see :attr:`Event.payload`. An empty payload means that the end of file was
+    reached or the read failed, the watch stops after sending it.
+
+    Events are sent without blocking since all file objects may be watched by
+    one thread. When the queue of the state machine is full, data read from
+    the file object is dropped and counted in :attr:`dropped`. Events which
+    stop the watch, readiness and end of file, are instead sent again after
+    :attr:`retry_interval` seconds.
+
+    Otherwise the event only tells that the file object is ready. The watch
+    stops after sending it, the handler does the I/O and calls
+    :meth:`start` through the ``watch`` attribute of the event to watch the
+    file object again.
+
+    The watch is released when the state machine terminates. Use
+    :meth:`State.set_local` to release it when the state is exited.
+
+    Args:
+        * fileobj (:obj:`object`): File descriptor or an object with a
+          ``fileno()`` method.
+        * event_name (:obj:`str`): Name of event.
+        * writable (:obj:`bool`, *optional*): Watch whether the file object
+          is ready for writing instead of reading. Default is ``False``.
+        * read_size (:obj:`int`, *optional*): Maximum number of bytes read at
+          once. Default is ``None`` which means that the watch does not read.
+
+    Example:
+        In order to receive data of a socket while in a state do::
+
+            def on_entry(self):
+                self.set_local(fsm.Watch(self.sm.sock, 'data', read_size=4096))
+
+            def on_data(self, event):
+                if not event.payload:
+                    return Closed
+                self.sm.parser.feed(event.payload)
+    """
+    retry_interval = 0.01
+
+    def __init__(self, fileobj, event_name, writable=False, read_size=None):
+        sm = current()
+        super().__init__(
+            category='watch',
+            name='{}.{}'.format(self.__class__.__name__, event_name),
+            owner=sm,
+            releaser=self.cancel)
+        self.sm = sm
+        self.fileobj = fileobj
+        self.event_name = event_name
+        self.writable = writable
+        self.read_size = read_size
+        self.dropped = 0
+        self._retry = None
+        self._watcher = coordinator.provider.Watcher(
+            fileobj, writable, self.handler)
+        Resource.add_resource(self)
         self.start()
 
+    def _read(self):
+        fileobj = self.fileobj
+        if hasattr(fileobj, 'recv'):
+            return fileobj.recv(self.read_size)
+        if not isinstance(fileobj, int):
+            fileobj = fileobj.fileno()
+        return os.read(fileobj, self.read_size)
+
+    def handler(self):
+        """Ready handler method.
+        """
+        if self.read_size is None:
+            self._watcher.cancel()
+            event = Event(self.event_name)
+        else:
+            try:
+                data = self._read()
+            except (BlockingIOError, InterruptedError):
+                return
+            except OSError as e:
+                self.sm.logger.warning('{} {} read failed: {}'.format(
+                    self.sm.name, self.event_name, e))
+                data = b''
+            if not data:
+                self._watcher.cancel()
+            event = Event(self.event_name, payload=data)
+        event.watch = self
+        self._send(event)
+
+    def _send(self, event):
+        self._retry = None
+        try:
+            self.sm.send(event, block=False)
+        except BufferError:
+            if event.payload:
+                self.dropped += 1
+                self.sm.logger.warning('{} {} dropped, queue is full'.format(
+                    self.sm.name, self.event_name))
+                event.release_payload()
+                return
+            # The watch has stopped, losing the event would strand the state
+            # machine
+            self._retry = coordinator.provider.Timer(
+                self.retry_interval, lambda: self._send(event))
+            self._retry.start()
+
+    def start(self):
+        """Start watching.
+
+        Use this method to watch again after a readiness event or after the
+        watch has been cancelled.
+        """
+        self._watcher.start()
+
+    def cancel(self):
+        """Stop watching.
+        """
+        self._watcher.cancel()
+        retry = self._retry
+        if retry is not None:
+            self._retry = None
+            retry.cancel()
+
 
 def current():
     """Returns the currently executing state machine.
@@ -936,8 +1938,23 @@ def current():
         * :obj:`None`: When this function is called outside of a state machine
           code context.
     """
+    sm = getattr(_inline, 'sm', None)
+    if sm is not None:
+        return sm
     current = coordinator.provider.current()
     try:
         return current.sm
     except AttributeError:
         pass
+
+
+class _Signal(Event):
+    """Internal event which is delivered to handlers without event argument.
+    """
+    def execute(self, handler):
+        return handler()
+
+
+_ENTRY = _Signal.shared('entry')
+_EXIT = _Signal.shared('exit')
+_INIT = _Signal.shared('init')
@@ -10,6 +10,8 @@ Module details
 Created on Jul 22, 2017
 """
 
+import types
+
 __author__ = 'Nenad Radulovic <nenad.b.radulovic@gmail.com>'
 
 
@@ -21,10 +23,85 @@ class Immutable(object):
 
     When trying to modify an attribute that is already set the
     ``AttributeError``  will be raised.
+
+    The slots and the class attributes of each class are collected once, so
+    an assignment only looks at the slot or the instance dictionary of the
+    attribute.
     """
+    __slots__ = ()
+    _fields = {}
+
+    @staticmethod
+    def _fields_of(cls):
+        fields = Immutable._fields.get(cls)
+        if fields is None:
+            slots = {}
+            names = set()
+            for klass in cls.__mro__:
+                for name, attr in vars(klass).items():
+                    if name in slots or name in names:
+                        continue
+                    if isinstance(attr, types.MemberDescriptorType):
+                        slots[name] = attr
+                    else:
+                        names.add(name)
+            fields = Immutable._fields.setdefault(cls, (slots, names))
+        return fields
+
     def __setattr__(self, name, value):
-        if hasattr(self, name):
+        cls = self.__class__
+        slots, names = Immutable._fields_of(cls)
+        slot = slots.get(name)
+        if slot is not None:
+            try:
+                slot.__get__(self, cls)
+                is_set = True
+            except AttributeError:
+                is_set = False
+        else:
+            is_set = name in names or name in getattr(self, '__dict__', ())
+        if is_set:
             raise AttributeError(
                     'Can\'t set attribute \'{}\', {} object is immutable'
-                    .format(name, self.__class__.__name__))
+                    .format(name, cls.__name__))
         object.__setattr__(self, name, value)
+
+
+class RunningStats(object):
+    """Running statistics of a series of samples
+
+    Mean and variance are updated with Welford's algorithm, so no samples
+    are kept.
+
+    Attributes:
+        * count (:obj:`int`): Number of samples.
+        * mean (:obj:`float`): Mean value of samples.
+        * max (:obj:`float`): Maximum sample value, ``None`` when there are
+          no samples.
+    """
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.max = None
+        self._m2 = 0.0
+
+    def update(self, value):
+        """Add a sample
+
+        Args:
+            * value (:obj:`float`): Sample value.
+        """
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self._m2 += delta * (value - self.mean)
+        if self.max is None or value > self.max:
+            self.max = value
+
+    @property
+    def stdev(self):
+        """:obj:`float`: Standard deviation of samples
+        """
+        if self.count < 2:
+            return 0.0
+        return (self._m2 / (self.count - 1)) ** 0.5
@@ -0,0 +1,295 @@
+"""
+Shard
+=====
+
+Sharding executes state machines in a number of worker processes, so that
+handlers of different state machines run on different CPU cores.
+
+Each state machine is placed on a shard by a stable hash of its name, see
+:func:`shard_of`. Every process knows the inbound queues of all shards, so an
+event addressed by a state machine name is put directly into the queue of the
+shard which executes that state machine:
+
+    * From the process which started the pool use :meth:`ShardPool.send`,
+      :meth:`ShardPool.send_many` or the proxy returned by
+      :meth:`ShardPool.get`.
+    * From any process, ``event.send('name')`` routes the event when there is
+      no state machine with that name in the process.
+
+Messages between processes carry batches of events. The events of one
+:meth:`ShardPool.send_many` call are grouped per shard and each group is
+sent as one message. Events are serialized without their owner, see
+:meth:`pyeds.fsm.Event.__reduce_ex__`.
+
+A worker puts events into the queues of its state machines without
+blocking. When the queue of a state machine is full the event is dropped and
+a warning is logged, so a slow state machine does not hold up the other state
+machines of its shard. A worker remembers the state machines it has
+created, so events sent right after :meth:`ShardPool.create` are delivered
+even before the state machine has started.
+
+Module details
+--------------
+
+Created on Oct 17, 2026
+"""
+import logging
+import multiprocessing
+import os
+import zlib
+
+from . import coordinator
+from . import fsm
+
+router = None
+'''Router of events to state machines in other processes.
+
+It is ``None`` when the process does not take part in sharding.
+'''
+
+_logger = logging.getLogger(__name__)
+
+
+def shard_of(name, shards):
+    """Get the shard of a state machine.
+
+    The hash of the name is stable across processes and interpreter runs.
+
+    Args:
+        * name (:obj:`str`): State machine name.
+        * shards (:obj:`int`): Number of shards.
+
+    Returns:
+        * :obj:`int`: Index of the shard.
+    """
+    return zlib.crc32(name.encode('utf-8')) % shards
+
+
+class _Router:
+    def __init__(self, queues):
+        self.queues = queues
+
+    def send(self, name, event):
+        index = shard_of(name, len(self.queues))
+        self.queues[index].put(('events', [(name, event)]))
+
+    def send_many(self, pairs):
+        batches = {}
+        for name, event in pairs:
+            index = shard_of(name, len(self.queues))
+            batches.setdefault(index, []).append((name, event))
+        for index, batch in batches.items():
+            self.queues[index].put(('events', batch))
+
+
+def _lookup(name, created):
+    state_machines = fsm.Resource.get_resources('state machine', name)
+    if state_machines:
+        created.pop(name, None)
+        return state_machines[0]
+    # A state machine enters resource management when its task starts, the
+    # events which follow its creation may come earlier
+    state_machine = created.get(name)
+    if state_machine is not None and not state_machine._thread.is_alive():
+        del created[name]
+        return None
+    return state_machine
+
+
+def _worker(index, queues, provider):
+    global router
+
+    if provider is not None:
+        coordinator.set_provider(provider)
+    router = _Router(queues)
+    inbox = queues[index]
+    created = {}
+    while True:
+        kind, payload = inbox.get()
+        if kind == 'events':
+            for name, event in payload:
+                state_machine = _lookup(name, created)
+                if state_machine is None:
+                    _logger.warning(
+                        'shard {}: no state machine {!r}, {} dropped'.format(
+                            index, name, event.name))
+                    continue
+                # One state machine must not hold up or stop the shard
+                try:
+                    state_machine.send(event, block=False)
+                except BufferError:
+                    _logger.warning(
+                        'shard {}: {} {} dropped, queue is full'.format(
+                            index, name, event.name))
+                except Exception:
+                    _logger.exception(
+                        'shard {}: sending {} to {!r} failed'.format(
+                            index, event.name, name))
+        elif kind == 'create':
+            factory, name, args, kwargs = payload
+            try:
+                created[name] = factory(*args, name=name, **kwargs)
+            except Exception:
+                _logger.exception(
+                    'shard {}: creating {!r} failed'.format(index, name))
+        elif kind == 'stop':
+            break
+    state_machines = fsm.Resource.filter_resources(category='state machine')
+    registered = set(state_machines)
+    state_machines += [
+        state_machine for state_machine in created.values()
+        if state_machine not in registered and
+        state_machine._thread.is_alive()]
+    for state_machine in state_machines:
+        state_machine.do_terminate()
+    for state_machine in state_machines:
+        state_machine.wait()
+
+
+class RemoteStateMachine:
+    """Proxy of a state machine executed by a shard.
+
+    Args:
+        * pool (:obj:`ShardPool`): Pool which executes the state machine.
+        * name (:obj:`str`): State machine name.
+    """
+    def __init__(self, pool, name):
+        self.pool = pool
+        self.name = name
+
+    def send(self, event):
+        """Send an event to the state machine.
+
+        Args:
+            * event (:obj:`Event`): Event object to send.
+        """
+        self.pool.send(self.name, event)
+
+    def send_many(self, events):
+        """Send a sequence of events to the state machine in one message.
+
+        Args:
+            * events (:obj:`iterable` of :obj:`Event`): Events to send.
+        """
+        self.pool.send_many((self.name, event) for event in events)
+
+
+class ShardPool:
+    """Executes state machines in worker processes.
+
+    State machines are created in the workers with :meth:`create`. The first
+    pool started in a process becomes the router of the process, so
+    ``event.send('name')`` reaches state machines of the pool.
+
+    Args:
+        * processes (:obj:`int`, *optional*): Number of worker processes.
+          Default is ``None`` which means the number of CPUs.
+        * provider (:obj:`str`, *optional*): Name of the coordinator provider
+          used by the workers. Default is ``None`` which means the default
+          provider.
+        * context (:obj:`str`, *optional*): Multiprocessing start method or
+          context. Default is ``None`` which means the default context.
+
+    Example::
+
+        pool = shard.ShardPool(4, provider='pool')
+        pool.start()
+        for idx in range(50000):
+            pool.create('worker{}'.format(idx), WorkerFsm)
+        pool.get('worker42').send(fsm.Event('job'))
+    """
+    def __init__(self, processes=None, provider=None, context=None):
+        if context is None or isinstance(context, str):
+            context = multiprocessing.get_context(context)
+        self.processes = processes or os.cpu_count() or 1
+        self.provider = provider
+        self._context = context
+        self._router = _Router(
+            [context.Queue() for _ in range(self.processes)])
+        self._workers = []
+
+    def start(self):
+        """Start the worker processes."""
+        global router
+
+        for index in range(self.processes):
+            worker = self._context.Process(
+                target=_worker,
+                args=(index, self._router.queues, self.provider),
+                name='pyeds-shard-{}'.format(index),
+                daemon=True)
+            worker.start()
+            self._workers += [worker]
+        if router is None:
+            router = self._router
+
+    def create(self, name, factory, *args, **kwargs):
+        """Create a state machine in the shard of its name.
+
+        The state machine is created by calling *factory* in the worker
+        process, with the *name* keyword argument added to the given
+        arguments. The factory and the arguments must be picklable.
+
+        Args:
+            * name (:obj:`str`): State machine name.
+            * factory (:obj:`callable`): Usually a state machine class.
+
+        Returns:
+            * :obj:`RemoteStateMachine`: Proxy of the state machine.
+        """
+        index = shard_of(name, self.processes)
+        self._router.queues[index].put(
+            ('create', (factory, name, args, kwargs)))
+        return RemoteStateMachine(self, name)
+
+    def get(self, name):
+        """Get a proxy of a state machine executed by this pool.
+
+        Args:
+            * name (:obj:`str`): State machine name.
+
+        Returns:
+            * :obj:`RemoteStateMachine`: Proxy of the state machine.
+        """
+        return RemoteStateMachine(self, name)
+
+    def send(self, name, event):
+        """Send an event to a state machine.
+
+        Args:
+            * name (:obj:`str`): State machine name.
+            * event (:obj:`Event`): Event object to send.
+        """
+        self._router.send(name, event)
+
+    def send_many(self, pairs):
+        """Send events with one message per shard.
+
+        Args:
+            * pairs (:obj:`iterable` of :obj:`tuple`): Pairs of state machine
+              name and event.
+        """
+        self._router.send_many(pairs)
+
+    def stop(self):
+        """Terminate all state machines and stop the worker processes.
+
+        Messages sent before this call are processed first.
+        """
+        global router
+
+        for queue in self._router.queues:
+            queue.put(('stop', None))
+        if router is self._router:
+            router = None
+
+    def join(self, timeout=None):
+        """Wait until the worker processes exit.
+
+        Args:
+            * timeout (:obj:`float`, *optional*): How many seconds to wait for
+              each worker. Default is ``None`` which means to wait
+              indefinitely.
+        """
+        for worker in self._workers:
+            worker.join(timeout)
@@ -0,0 +1,174 @@
+'''
+Created on Oct 17, 2026
+'''
+import asyncio
+import threading
+import time
+import unittest
+
+from pyeds import coordinator
+from pyeds import fsm
+
+
+class CounterFSM(fsm.StateMachine):
+    def __init__(self, name):
+        self.count = 0
+        self.active = False
+        self.overlapped = False
+        self.foreign = False
+        super().__init__(name=name)
+
+
+@fsm.DeclareState(CounterFSM)
+class Counting(fsm.State):
+    def on_start_timer(self, event):
+        fsm.After(0.01, 'inc')
+
+    def on_inc(self, event):
+        if self.sm.active:
+            self.sm.overlapped = True
+        self.sm.active = True
+        if fsm.current() is not self.sm:
+            self.sm.foreign = True
+        self.sm.count += 1
+        self.sm.active = False
+
+    def on_fail(self, event):
+        raise RuntimeError('failed')
+
+
+class TimerServiceTestCase(unittest.TestCase):
+    def setUp(self):
+        self.service = coordinator.TimerService()
+        self.fired = {}
+        self.done = threading.Event()
+
+    def handler(self, name):
+        def fire():
+            self.fired[name] = time.monotonic()
+            if len(self.fired) == 2:
+                self.done.set()
+        return fire
+
+    def test_order(self):
+        now = time.monotonic()
+        self.service.schedule(now + 0.02, self.handler('second'))
+        self.service.schedule(now + 0.01, self.handler('first'))
+        cancelled = self.service.schedule(now, self.handler('cancelled'))
+        self.service.cancel(cancelled)
+        self.assertTrue(self.done.wait(5))
+        self.assertLess(self.fired['first'], self.fired['second'])
+        self.assertNotIn('cancelled', self.fired)
+
+    def test_slack_coalescing(self):
+        now = time.monotonic()
+        self.service.schedule(now + 0.02, self.handler('first'), 0.1)
+        self.service.schedule(now + 0.08, self.handler('second'), 0.1)
+        self.assertTrue(self.done.wait(5))
+        # Both expire in the window of the first timer, in one wake-up
+        self.assertGreaterEqual(self.fired['first'], now + 0.08)
+        self.assertLess(self.fired['second'] - self.fired['first'], 0.01)
+
+    def test_batched_delivery(self):
+        batches = []
+        delivered = threading.Event()
+
+        def flush(items):
+            batches.append(items)
+            delivered.set()
+
+        def handler(name):
+            return lambda: coordinator.deliver(flush, name)
+
+        now = time.monotonic()
+        self.service.schedule(now + 0.02, handler('first'), 0.1)
+        self.service.schedule(now + 0.08, handler('second'), 0.1)
+        self.assertTrue(delivered.wait(5))
+        # Timers expired in one wake-up deliver their items together
+        self.assertEqual([['first', 'second']], batches)
+        coordinator.deliver(flush, 'direct')
+        self.assertEqual(['direct'], batches[-1])
+
+
+class PoolProviderTestCase(unittest.TestCase):
+    def setUp(self):
+        coordinator.providers['test_pool'] = coordinator.pool_provider(4)
+        coordinator.set_provider('test_pool')
+
+    def tearDown(self):
+        coordinator.set_provider('std')
+
+    def test_many_machines(self):
+        threads = threading.active_count()
+        machines = [
+            CounterFSM('counter{}'.format(idx)) for idx in range(200)]
+        for _ in range(50):
+            for sm in machines:
+                sm.send(fsm.Event('inc'), block=False)
+        for sm in machines:
+            sm.do_terminate()
+        for sm in machines:
+            sm.wait()
+        self.assertLessEqual(threading.active_count(), threads + 4)
+        for sm in machines:
+            self.assertEqual(50, sm.count)
+            self.assertFalse(sm.overlapped)
+            self.assertFalse(sm.foreign)
+
+    def test_failed_task_is_logged(self):
+        sm = CounterFSM('pool_failing')
+        with self.assertLogs('pyeds.coordinator', 'ERROR') as logs:
+            sm.send(fsm.Event('fail'))
+            sm.wait(5)
+        self.assertIn('task pool_failing failed', logs.output[0])
+
+
+@unittest.skipUnless('asyncio' in coordinator.providers, 'requires asyncio')
+class AsyncioProviderTestCase(unittest.TestCase):
+    def setUp(self):
+        coordinator.set_provider('asyncio')
+
+    def tearDown(self):
+        coordinator.set_provider('std')
+
+    def test_machines_in_loop(self):
+        async def main():
+            machines = [
+                CounterFSM('async{}'.format(idx)) for idx in range(20)]
+            for _ in range(10):
+                for sm in machines:
+                    sm.send(fsm.Event('inc'))
+            for sm in machines:
+                sm.do_terminate()
+                await sm.wait()
+            return machines
+
+        for sm in asyncio.run(main()):
+            self.assertEqual(10, sm.count)
+            self.assertFalse(sm.foreign)
+
+    def test_send_from_thread_and_timer(self):
+        async def main():
+            sm = CounterFSM('async_foreign')
+
+            def producer():
+                for _ in range(10):
+                    sm.send(fsm.Event('inc'))
+                sm.send(fsm.Event('start_timer'))
+
+            thread = threading.Thread(target=producer)
+            thread.start()
+            while sm.count < 11:
+                await asyncio.sleep(0.01)
+            thread.join()
+            sm.do_terminate()
+            await sm.wait()
+            return sm
+
+        sm = asyncio.run(asyncio.wait_for(main(), 5))
+        self.assertEqual(11, sm.count)
+        self.assertFalse(sm.foreign)
+
+
+if __name__ == '__main__':
+    unittest.main()
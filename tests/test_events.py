@@ -3,6 +3,7 @@ Created on Jul 24, 2017
 
 @author: nenad
 '''
+import time
 import unittest
 
 from pyeds import fsm
@@ -52,6 +53,70 @@ class EventTestCase(unittest.TestCase):
         self.assertRaises(
                 AttributeError,
                 event_name_set, event)
+        event.data = 1
+        self.assertRaises(AttributeError, setattr, event, 'data', 2)
+        # Class attributes and methods can't be shadowed either
+        self.assertRaises(AttributeError, setattr, event, 'priority', 1)
+        self.assertRaises(AttributeError, setattr, event, 'send', None)
+        event.timer = None
+        self.assertRaises(AttributeError, setattr, event, 'timer', None)
+
+    def test_event_slots_payload(self):
+        class SlottedEvent(fsm.Event):
+            __slots__ = ('value',)
+        event = SlottedEvent()
+        event.value = 1
+        self.assertEqual('slotted_event', event.name)
+        self.assertEqual(1, event.value)
+        self.assertRaises(
+                AttributeError,
+                setattr, event, 'value', 2)
+
+    def test_event_class_name_per_class(self):
+        class FirstEvent(fsm.Event):
+            pass
+
+        class SecondEvent(FirstEvent):
+            pass
+        self.assertEqual('first_event', FirstEvent().name)
+        self.assertEqual('second_event', SecondEvent().name)
+        self.assertEqual('first_event', FirstEvent().name)
+
+    def test_event_shared(self):
+        class SharedEvent(fsm.Event):
+            pass
+        event = SharedEvent.shared()
+        self.assertIs(event, SharedEvent.shared())
+        self.assertIsNot(event, fsm.Event.shared('shared_event'))
+        self.assertIs(
+            fsm.Event.shared('shared_event'),
+            fsm.Event.shared('shared_event'))
+        self.assertEqual('shared_event', event.name)
+        self.assertIsNone(event.owner)
+
+    def test_event_ttl(self):
+        class ShortLivedEvent(fsm.Event):
+            ttl = 1.0
+        self.assertIsNone(fsm.Event('a').deadline)
+        now = time.monotonic()
+        self.assertLessEqual(now + 2.0, fsm.Event('a', ttl=2.0).deadline)
+        self.assertLessEqual(now + 1.0, ShortLivedEvent().deadline)
+        self.assertIsNone(ShortLivedEvent.shared().deadline)
+        self.assertRaises(
+            AttributeError, setattr, fsm.Event('a', ttl=1.0), 'deadline', 0)
+
+    def test_event_payload(self):
+        frame = bytearray(b'header')
+        event = fsm.Event('frame', payload=frame)
+        self.assertIsNone(fsm.Event('a').payload)
+        self.assertIsInstance(event.payload, memoryview)
+        frame[0:1] = b'H'
+        self.assertEqual(b'Header', event.payload.tobytes())
+        self.assertRaises(AttributeError, setattr, event, 'payload', None)
+        self.assertRaises(TypeError, fsm.Event, 'frame', payload='text')
+        event.release_payload()
+        self.assertRaises(ValueError, len, event.payload)
+        event.release_payload()
 
 
 if __name__ == '__main__':
@@ -0,0 +1,157 @@
+'''
+Created on Oct 17, 2026
+'''
+import threading
+import unittest
+
+from pyeds import fsm
+
+
+class ParserFSM(fsm.StateMachine):
+    is_passive = True
+
+    def __init__(self, name):
+        self.out_seq = []
+        self.threads = []
+        self.ticked = threading.Event()
+        super().__init__(name=name)
+
+
+@fsm.DeclareState(ParserFSM)
+class Header(fsm.State):
+    def on_init(self):
+        self.sm.out_seq += ['header:i']
+
+    def on_byte(self, event):
+        self.sm.out_seq += ['header:{}'.format(event.value)]
+        self.sm.threads += [threading.current_thread()]
+        if fsm.current() is not self.sm:
+            self.sm.out_seq += ['foreign']
+        # Posted from a handler, dispatched after this event
+        self.sm.send(fsm.Event('header_done'))
+        self.sm.out_seq += ['header:sent']
+
+    def on_header_done(self, event):
+        return Body
+
+    def on_start_timer(self, event):
+        fsm.After(0.01, 'tick')
+
+    def on_tick(self, event):
+        self.sm.threads += [threading.current_thread()]
+        self.sm.ticked.set()
+
+
+@fsm.DeclareState(ParserFSM)
+class Body(fsm.State):
+    def on_entry(self):
+        self.sm.out_seq += ['body:e']
+
+    def on_byte(self, event):
+        self.sm.out_seq += ['body:{}'.format(event.value)]
+
+
+class Byte(fsm.Event):
+    def __init__(self, value):
+        super().__init__()
+        self.value = value
+
+
+class CountingFSM(fsm.StateMachine):
+    is_passive = True
+
+    def __init__(self, name):
+        self.count = 0
+        self.seq = []
+        super().__init__(queue_size=0, name=name)
+
+
+@fsm.DeclareState(CountingFSM)
+class Counting(fsm.State):
+    def on_inc(self, event):
+        self.sm.count += 1
+
+    def on_fail(self, event):
+        self.sm.send(fsm.Event('after'))
+        raise ValueError('fail')
+
+    def on_after(self, event):
+        self.sm.seq += ['after']
+
+
+class PassiveTestCase(unittest.TestCase):
+    def test_inline_dispatch(self):
+        threads = threading.active_count()
+        sm = ParserFSM('parser')
+        self.assertEqual(threads, threading.active_count())
+        sm.send(Byte(1))
+        # Deferred event was dispatched before send() returned
+        self.assertEqual(
+            ['header:i', 'header:1', 'header:sent', 'body:e'], sm.out_seq)
+        sm.dispatch(Byte(2))
+        self.assertEqual('body:2', sm.out_seq[-1])
+        self.assertEqual([threading.current_thread()], sm.threads)
+        self.assertIsNone(fsm.current())
+        sm.do_terminate()
+        sm.wait()
+        self.assertNotIn(
+            sm, fsm.Resource.filter_resources(category='state machine'))
+
+    def test_not_started(self):
+        class LazyParserFSM(ParserFSM):
+            should_autostart = False
+        sm = LazyParserFSM('lazy_parser')
+        sm.send(Byte(1))
+        self.assertEqual([], sm.out_seq)
+        sm.do_start()
+        self.assertEqual(
+            ['header:i', 'header:1', 'header:sent', 'body:e'], sm.out_seq)
+        sm.do_terminate()
+
+    def test_timer(self):
+        sm = ParserFSM('timer_parser')
+        sm.send(fsm.Event('start_timer'))
+        self.assertTrue(sm.ticked.wait(5))
+        self.assertIsNot(threading.current_thread(), sm.threads[-1])
+        sm.do_terminate()
+
+    def test_concurrent_senders(self):
+        sm = CountingFSM('concurrent')
+
+        def sender():
+            for _ in range(500):
+                sm.send(fsm.Event('inc'))
+
+        threads = [threading.Thread(target=sender) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        # No event is left behind once every send() has returned
+        self.assertEqual(4000, sm.count)
+        self.assertEqual(0, sm.queue.qsize())
+        sm.do_terminate()
+
+    def test_handler_exception(self):
+        sm = CountingFSM('failing')
+        self.assertRaises(RuntimeError, sm.send, fsm.Event('fail'))
+        # The event deferred by the failing handler was dispatched
+        self.assertEqual(['after'], sm.seq)
+        sm.send(fsm.Event('inc'))
+        self.assertEqual(1, sm.count)
+        sm.do_terminate()
+
+    def test_dispatch_requires_passive(self):
+        class ActiveFSM(fsm.StateMachine):
+            should_autostart = False
+
+        @fsm.DeclareState(ActiveFSM)
+        class Idle(fsm.State):
+            pass
+
+        sm = ActiveFSM()
+        self.assertRaises(RuntimeError, sm.dispatch, fsm.Event('a'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,135 @@
+'''
+Created on Oct 17, 2026
+'''
+import threading
+import unittest
+
+from pyeds import fsm
+
+
+class ResourceTestCase(unittest.TestCase):
+    def setUp(self):
+        self.released = []
+
+    def make(self, name, owner=None, category='test'):
+        return fsm.Resource(
+            category=category,
+            name=name,
+            owner=owner,
+            releaser=lambda: self.released.append(name))
+
+    def tearDown(self):
+        for resource in fsm.Resource.filter_resources(category='test'):
+            fsm.Resource.remove_resource(resource)
+
+    def test_get_resources(self):
+        first = self.make('a')
+        second = self.make('a')
+        fsm.Resource.add_resource(first)
+        fsm.Resource.add_resource(second)
+        self.assertEqual(
+            [first, second],
+            fsm.Resource.get_resources('test', 'a'))
+        self.assertEqual([], fsm.Resource.get_resources('test', 'b'))
+
+    def test_remove_resource_by_identity(self):
+        first = self.make('first')
+        second = fsm.Resource(
+            category='test',
+            name='first',
+            releaser=lambda: self.released.append('second'))
+        fsm.Resource.add_resource(first)
+        fsm.Resource.add_resource(second)
+        fsm.Resource.remove_resource(second)
+        self.assertEqual(['second'], self.released)
+        self.assertEqual([first], fsm.Resource.get_resources('test', 'first'))
+        self.assertRaises(
+            LookupError,
+            fsm.Resource.remove_resource, second)
+
+    def test_filter_resources(self):
+        owner = object()
+        first = self.make('a', owner)
+        second = self.make('b', owner)
+        third = self.make('a')
+        for resource in (first, second, third):
+            fsm.Resource.add_resource(resource)
+        self.assertEqual(
+            [first, second],
+            fsm.Resource.filter_resources(owner=owner))
+        self.assertEqual(
+            [first],
+            fsm.Resource.filter_resources(owner=owner, name='a'))
+        self.assertEqual(
+            [first, third],
+            fsm.Resource.filter_resources(category='test', name='a'))
+        self.assertEqual(
+            [first, third, second],
+            fsm.Resource.filter_resources(category='test'))
+
+    def test_remove_all_resources(self):
+        owner = object()
+        first = self.make('a', owner)
+        second = self.make('b', owner)
+        third = self.make('c')
+        for resource in (first, second, third):
+            fsm.Resource.add_resource(resource)
+        fsm.Resource.remove_all_resources(owner)
+        self.assertEqual(['a', 'b'], self.released)
+        self.assertEqual([], fsm.Resource.filter_resources(owner=owner))
+        self.assertEqual(
+            [third],
+            fsm.Resource.filter_resources(category='test'))
+
+    def test_set_owner(self):
+        owner = object()
+        first = self.make('a')
+        fsm.Resource.set_owner(first, owner)
+        self.assertEqual([first], fsm.Resource.filter_resources(owner=owner))
+        other = object()
+        fsm.Resource.set_owner(first, other)
+        self.assertEqual([], fsm.Resource.filter_resources(owner=owner))
+        self.assertEqual([first], fsm.Resource.filter_resources(owner=other))
+
+    def test_unowned_resources_are_not_indexed(self):
+        resources = [self.make('unowned{}'.format(idx)) for idx in range(3)]
+        for resource in resources:
+            fsm.Resource.add_resource(resource)
+        self.assertNotIn(None, fsm.Resource._owners)
+        self.assertEqual(
+            resources[:1],
+            fsm.Resource.filter_resources(category='test', name='unowned0'))
+        owner = object()
+        fsm.Resource.set_owner(resources[0], owner)
+        self.assertEqual(
+            resources[:1], fsm.Resource.filter_resources(owner=owner))
+        fsm.Resource.set_owner(resources[0], None)
+        self.assertEqual([], fsm.Resource.filter_resources(owner=owner))
+        self.assertEqual(
+            resources[:1],
+            fsm.Resource.get_resources('test', 'unowned0'))
+
+    def test_concurrent_add_remove(self):
+        owner = object()
+
+        def worker(index):
+            for _ in range(500):
+                resource = fsm.Resource(
+                    category='test',
+                    name='concurrent{}'.format(index % 2),
+                    owner=owner)
+                fsm.Resource.add_resource(resource)
+                fsm.Resource.remove_resource(resource)
+
+        threads = [
+            threading.Thread(target=worker, args=(i,)) for i in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual([], fsm.Resource.filter_resources(owner=owner))
+        self.assertEqual([], fsm.Resource.filter_resources(category='test'))
+
+
+if __name__ == '__main__':
+    unittest.main()
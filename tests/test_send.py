@@ -0,0 +1,420 @@
+'''
+Created on Oct 17, 2026
+'''
+import time
+import unittest
+
+from pyeds import coordinator
+from pyeds import fsm
+
+
+class RecorderFSM(fsm.StateMachine):
+    should_autostart = False
+
+    def __init__(self, name, queue_size=64):
+        self.received = []
+        self.events = []
+        super().__init__(queue_size=queue_size, name=name)
+
+
+@fsm.DeclareState(RecorderFSM)
+class Recording(fsm.State):
+    def on_unhandled_event(self, event):
+        self.sm.received += [event.name]
+        self.sm.events += [event]
+
+
+class SendTestCase(unittest.TestCase):
+    def finish(self, *machines):
+        for sm in machines:
+            sm.do_start()
+            sm.do_terminate()
+        for sm in machines:
+            sm.wait()
+
+    def test_send_many(self):
+        sm = RecorderFSM('send_many')
+        events = [fsm.Event('e{}'.format(idx)) for idx in range(10)]
+        sm.send_many(events)
+        self.assertEqual(
+            events,
+            [e for e in fsm.Resource.filter_resources(category='event')
+             if e in events])
+        self.finish(sm)
+        self.assertEqual([e.name for e in events], sm.received)
+        self.assertEqual(
+            [],
+            [e for e in fsm.Resource.filter_resources(category='event')
+             if e in events])
+
+    def test_send_many_full(self):
+        sm = RecorderFSM('send_many_full', queue_size=4)
+        events = [fsm.Event('e{}'.format(idx)) for idx in range(6)]
+        with self.assertRaises(BufferError) as context:
+            sm.send_many(events, block=False)
+        self.assertEqual(4, context.exception.args[0])
+        # Events which did not fit are not left in resource management
+        self.assertEqual(
+            events[:4],
+            [e for e in fsm.Resource.filter_resources(category='event')
+             if e in events])
+        self.finish(sm)
+        self.assertEqual([e.name for e in events[:4]], sm.received)
+
+    def test_payload_released(self):
+        sm = RecorderFSM('payload')
+        frame = bytearray(b'frame')
+        event = fsm.Event('frame', payload=frame)
+        sm.send(event)
+        self.assertRaises(
+            ValueError, RecorderFSM.broadcast, event, [sm], False)
+        # The queued event shares the buffer of the frame
+        self.assertRaises(BufferError, frame.extend, b'!')
+        self.finish(sm)
+        self.assertIs(event, sm.events[0])
+        self.assertRaises(ValueError, bytes, event.payload)
+        frame.extend(b'!')
+
+    def test_broadcast(self):
+        machines = [RecorderFSM('broadcast{}'.format(idx)) for idx in range(5)]
+        full = RecorderFSM('broadcast_full', queue_size=1)
+        full.send(fsm.Event('filler'))
+        event = fsm.Event('reload')
+        missed = RecorderFSM.broadcast(event, machines + [full], block=False)
+        self.assertEqual([full], missed)
+        self.assertEqual([], fsm.Resource.get_resources('event', 'reload'))
+        self.finish(full, *machines)
+        for sm in machines:
+            self.assertEqual(['reload'], sm.received)
+        self.assertEqual(['filler'], full.received)
+
+    def test_broadcast_class(self):
+        machines = [RecorderFSM('class{}'.format(idx)) for idx in range(3)]
+        for sm in machines:
+            sm.do_start()
+        # State machines are registered when their event loop starts
+        deadline = time.monotonic() + 5
+        while time.monotonic() < deadline and not set(machines).issubset(
+                fsm.Resource.filter_resources(category='state machine')):
+            time.sleep(0.001)
+        RecorderFSM.broadcast(fsm.Event('config'))
+        for sm in machines:
+            sm.do_terminate()
+        for sm in machines:
+            sm.wait()
+        for sm in machines:
+            self.assertEqual(['config'], sm.received)
+
+
+class OverflowTestCase(unittest.TestCase):
+    def make(self, overflow):
+        cls = type(
+            'Overflow{}FSM'.format(overflow.title()),
+            (RecorderFSM,),
+            {'overflow': overflow})
+        return cls('overflow_{}'.format(overflow), queue_size=2)
+
+    def run_to_end(self, sm):
+        # The termination request is accepted by a full queue
+        sm.do_terminate()
+        sm.do_start()
+        sm.wait()
+
+    def queued(self, events):
+        return [
+            e for e in fsm.Resource.filter_resources(category='event')
+            if e in events]
+
+    def test_reject(self):
+        sm = self.make('reject')
+        sm.send(fsm.Event('a'))
+        sm.send(fsm.Event('b'))
+        self.assertRaises(BufferError, sm.send, fsm.Event('c'), timeout=1)
+        self.run_to_end(sm)
+        self.assertEqual(['a', 'b'], sm.received)
+        self.assertEqual(0, sm.dropped_events)
+
+    def test_drop_oldest(self):
+        sm = self.make('drop_oldest')
+        events = [fsm.Event(name) for name in 'abc']
+        for event in events:
+            sm.send(event)
+        self.assertEqual(events[1:], self.queued(events))
+        self.run_to_end(sm)
+        self.assertEqual(['b', 'c'], sm.received)
+        self.assertEqual(1, sm.dropped_events)
+
+    def test_drop_newest(self):
+        sm = self.make('drop_newest')
+        events = [fsm.Event(name) for name in 'abc']
+        sm.send_many(events)
+        self.assertEqual(events[:2], self.queued(events))
+        self.run_to_end(sm)
+        self.assertEqual(['a', 'b'], sm.received)
+        self.assertEqual(1, sm.dropped_events)
+
+    def test_coalesce(self):
+        sm = self.make('coalesce')
+        first = fsm.Event('a')
+        sm.send(first)
+        sm.send(fsm.Event('b'))
+        last = fsm.Event('a')
+        sm.send(last)
+        self.assertRaises(BufferError, sm.send, fsm.Event('c'))
+        self.assertEqual([last], self.queued([first, last]))
+        self.run_to_end(sm)
+        self.assertEqual(['a', 'b'], sm.received)
+        self.assertEqual(1, sm.coalesced_events)
+        self.assertEqual(0, sm.dropped_events)
+
+    def test_discarded_payloads_are_released(self):
+        frames = [bytearray(b'frame') for _ in range(6)]
+        events = [fsm.Event('a', payload=frame) for frame in frames]
+        newest = self.make('drop_newest')
+        newest.should_register_events = False
+        newest.send_many(events[:3])
+        oldest = self.make('drop_oldest')
+        oldest.send_many(events[3:5])
+        oldest.send(fsm.Event('b'))
+        coalesce = self.make('coalesce')
+        coalesce.send(events[5])
+        coalesce.send(fsm.Event('b'))
+        coalesce.send(fsm.Event('a'))
+        # Dropped and replaced events no longer hold their frames
+        for frame in (frames[2], frames[3], frames[5]):
+            frame.extend(b'!')
+        # Events left behind by termination are released too
+        newest.do_terminate(is_urgent=True)
+        newest.do_start()
+        newest.wait()
+        self.assertEqual([], newest.received)
+        frames[0].extend(b'!')
+        self.run_to_end(oldest)
+        self.run_to_end(coalesce)
+        for frame in frames:
+            frame.extend(b'!')
+
+    def test_broadcast_discards(self):
+        sm = self.make('drop_oldest')
+        frame = bytearray(b'frame')
+        oldest = fsm.Event('a', payload=frame)
+        sm.send(oldest)
+        sm.send(fsm.Event('b'))
+        self.assertEqual([], RecorderFSM.broadcast(fsm.Event('c'), [sm]))
+        self.assertEqual([], self.queued([oldest]))
+        frame.extend(b'!')
+        self.run_to_end(sm)
+        self.assertEqual(['b', 'c'], sm.received)
+
+    def test_invalid_policy(self):
+        self.assertRaises(ValueError, self.make, 'invalid')
+
+
+class Alarm(fsm.Event):
+    priority = 10
+
+
+class PriorityTestCase(unittest.TestCase):
+    def run_to_end(self, sm, is_urgent=False):
+        sm.do_terminate(is_urgent=is_urgent)
+        sm.do_start()
+        sm.wait()
+
+    def test_event_class_priority(self):
+        sm = RecorderFSM('priority_class')
+        sm.send(fsm.Event('a'))
+        sm.send(fsm.Event('b'))
+        sm.send(Alarm())
+        sm.send(fsm.Event('c'))
+        self.run_to_end(sm)
+        self.assertEqual(['alarm', 'a', 'b', 'c'], sm.received)
+
+    def test_send_priority(self):
+        sm = RecorderFSM('priority_send')
+        sm.send(fsm.Event('low'), priority=-1)
+        sm.send_many([fsm.Event('first'), fsm.Event('second')], priority=5)
+        sm.send(fsm.Event('normal'))
+        sm.send(fsm.Event('third'), priority=5)
+        sm.send(Alarm(), priority=0)
+        self.run_to_end(sm)
+        # Termination request has priority 0, the low priority event is
+        # discarded
+        self.assertEqual(
+            ['first', 'second', 'third', 'normal', 'alarm'],
+            sm.received)
+        self.assertEqual([], fsm.Resource.get_resources('event', 'low'))
+
+    def test_urgent_terminate(self):
+        sm = RecorderFSM('priority_terminate')
+        events = [fsm.Event(name) for name in 'abc']
+        sm.send_many(events)
+        self.run_to_end(sm, is_urgent=True)
+        self.assertEqual([], sm.received)
+        self.assertEqual(
+            [],
+            [e for e in fsm.Resource.filter_resources(category='event')
+             if e in events])
+
+    def test_drop_oldest_lowest_priority(self):
+        cls = type('PriorityDropFSM', (RecorderFSM,), {
+            'overflow': 'drop_oldest'})
+        sm = cls('priority_drop', queue_size=2)
+        sm.send(Alarm())
+        sm.send(fsm.Event('a'))
+        sm.send(Alarm())
+        sm.send(fsm.Event('b'))
+        self.run_to_end(sm)
+        self.assertEqual(['alarm', 'alarm'], sm.received)
+        self.assertEqual(2, sm.dropped_events)
+
+
+class Reading(fsm.Event):
+    is_coalescible = True
+
+    def __init__(self, sensor, value):
+        super().__init__()
+        self.sensor = sensor
+        self.value = value
+
+    def coalesce_key(self):
+        return (self.name, self.sensor)
+
+
+class Ticks(fsm.Event):
+    is_coalescible = True
+
+    def __init__(self, count=1):
+        super().__init__()
+        self.count = count
+
+    def merge(self, pending):
+        return Ticks(pending.count + self.count)
+
+
+class CoalesceTestCase(unittest.TestCase):
+    def run_to_end(self, sm):
+        sm.do_terminate()
+        sm.do_start()
+        sm.wait()
+
+    def test_latest_wins(self):
+        sm = RecorderFSM('coalesce_latest')
+        first = Reading(1, 10)
+        sm.send(first)
+        sm.send(fsm.Event('other'))
+        sm.send(Reading(1, 11))
+        sm.send(Reading(2, 5))
+        sm.send(Reading(1, 12))
+        self.assertNotIn(first, fsm.Resource.get_resources('event', 'reading'))
+        self.run_to_end(sm)
+        self.assertEqual(['reading', 'other', 'reading'], sm.received)
+        self.assertEqual(
+            [(1, 12), (2, 5)],
+            [(e.sensor, e.value) for e in sm.events if e.name == 'reading'])
+        self.assertEqual(2, sm.coalesced_events)
+        self.assertEqual([], fsm.Resource.get_resources('event', 'reading'))
+
+    def test_merge(self):
+        sm = RecorderFSM('coalesce_merge')
+        sm.send_many(Ticks() for _ in range(5))
+        sm.send(fsm.Event('other'))
+        sm.send(Ticks(10))
+        self.run_to_end(sm)
+        self.assertEqual(['ticks', 'other'], sm.received)
+        self.assertEqual(15, sm.events[0].count)
+        self.assertEqual([], fsm.Resource.get_resources('event', 'ticks'))
+
+    def test_full_queue(self):
+        cls = type('CoalesceRejectFSM', (RecorderFSM,), {
+            'overflow': 'reject'})
+        sm = cls('coalesce_full', queue_size=2)
+        sm.send(Reading(1, 10))
+        sm.send(fsm.Event('other'))
+        sm.send(Reading(1, 11))
+        self.assertRaises(BufferError, sm.send, Reading(2, 5))
+        self.run_to_end(sm)
+        self.assertEqual(['reading', 'other'], sm.received)
+        self.assertEqual(11, sm.events[0].value)
+
+
+class ExpiryFSM(RecorderFSM):
+    def __init__(self, name):
+        self.expired = []
+        super().__init__(name)
+
+    def on_expired_event(self, event):
+        self.expired += [event.name]
+
+
+class ExpiryTestCase(unittest.TestCase):
+    def test_expired_events_are_dropped(self):
+        sm = ExpiryFSM('expiry')
+        stale = fsm.Event('stale', ttl=0.0)
+        sm.send(stale)
+        sm.send(fsm.Event('fresh', ttl=60.0))
+        sm.send(fsm.Event('forever'))
+        sm.send(fsm.Event('stale', ttl=0.0))
+        time.sleep(0.01)
+        sm.do_terminate()
+        sm.do_start()
+        sm.wait()
+        self.assertEqual(['fresh', 'forever'], sm.received)
+        self.assertEqual(['stale', 'stale'], sm.expired)
+        self.assertEqual({'stale': 2}, sm.expired_events)
+        self.assertEqual([], fsm.Resource.get_resources('event', 'stale'))
+
+
+class FilteringFSM(fsm.StateMachine):
+    should_autostart = False
+    should_filter_events = True
+
+    def __init__(self, name):
+        self.received = []
+        super().__init__(name=name)
+
+
+@fsm.DeclareState(FilteringFSM)
+class Filtering(fsm.State):
+    def on_wanted(self, event):
+        self.sm.received += [event.name]
+
+
+class FilterTestCase(unittest.TestCase):
+    def test_unhandled_events_are_filtered(self):
+        sm = FilteringFSM('filtering')
+        unwanted = fsm.Event('unwanted')
+        sm.send(fsm.Event('wanted'))
+        sm.send(unwanted)
+        sm.send_many([fsm.Event('unwanted'), fsm.Event('wanted')])
+        FilteringFSM.broadcast(fsm.Event('other'), [sm])
+        self.assertEqual([], fsm.Resource.get_resources('event', 'unwanted'))
+        sm.do_terminate()
+        sm.do_start()
+        sm.wait()
+        self.assertEqual(['wanted', 'wanted'], sm.received)
+        self.assertEqual({'unwanted': 2, 'other': 1}, sm.filtered_events)
+
+
+class PoolSendTestCase(unittest.TestCase):
+    def setUp(self):
+        coordinator.providers['test_pool'] = coordinator.pool_provider(2)
+        coordinator.set_provider('test_pool')
+
+    def tearDown(self):
+        coordinator.set_provider('std')
+
+    def test_send_many(self):
+        sm = RecorderFSM('pool_send_many', queue_size=4)
+        sm.do_start()
+        events = [fsm.Event('e{}'.format(idx)) for idx in range(20)]
+        sm.send_many(events)
+        sm.send(fsm.Event('last'))
+        while sm.received[-1:] != ['last']:
+            time.sleep(0.001)
+        sm.do_terminate()
+        sm.wait()
+        self.assertEqual([e.name for e in events] + ['last'], sm.received)
+
+
+if __name__ == '__main__':
+    unittest.main()
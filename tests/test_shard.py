@@ -0,0 +1,169 @@
+'''
+Created on Oct 17, 2026
+'''
+import multiprocessing
+import os
+import pickle
+import queue
+import time
+import unittest
+
+from pyeds import fsm
+from pyeds import shard
+
+# Inherited by the forked workers
+RESULTS = None
+
+
+class Ping(fsm.Event):
+    __slots__ = ('value',)
+
+    def __init__(self, value):
+        super().__init__()
+        self.value = value
+
+
+class Forward(fsm.Event):
+    def __init__(self, target, value):
+        super().__init__()
+        self.target = target
+        self.value = value
+
+
+class EchoFSM(fsm.StateMachine):
+    def __init__(self, name, queue_size=64):
+        super().__init__(queue_size=queue_size, name=name)
+
+
+@fsm.DeclareState(EchoFSM)
+class Echoing(fsm.State):
+    def on_ping(self, event):
+        RESULTS.put((self.sm.name, os.getpid(), event.value))
+
+    def on_stall(self, event):
+        time.sleep(0.2)
+
+    def on_forward(self, event):
+        Ping(event.value).send(event.target)
+
+
+class SerializationTestCase(unittest.TestCase):
+    def test_event_round_trip(self):
+        event = Forward('target', 42)
+        restored = pickle.loads(pickle.dumps(event))
+        self.assertIsInstance(restored, Forward)
+        self.assertEqual('forward', restored.name)
+        self.assertEqual(('target', 42), (restored.target, restored.value))
+        self.assertIsNone(restored.owner)
+        restored = pickle.loads(pickle.dumps(Ping(3)))
+        self.assertEqual(3, restored.value)
+        self.assertRaises(AttributeError, setattr, restored, 'value', 4)
+
+    @unittest.skipUnless(
+        pickle.HIGHEST_PROTOCOL >= 5, 'requires pickle protocol 5')
+    def test_event_payload(self):
+        event = fsm.Event('frame', payload=bytearray(b'\x00data'))
+        buffers = []
+        data = pickle.dumps(event, 5, buffer_callback=buffers.append)
+        self.assertNotIn(b'\x00data', data)
+        self.assertEqual(b'\x00data', bytes(buffers[0].raw()))
+        restored = pickle.loads(data, buffers=buffers)
+        self.assertEqual(b'\x00data', restored.payload.tobytes())
+        restored = pickle.loads(pickle.dumps(event, 4))
+        self.assertEqual(b'\x00data', restored.payload.tobytes())
+
+    def test_event_send_by_name(self):
+        self.assertRaises(LookupError, fsm.Event('a').send, 'missing_fsm')
+
+
+class ShardPoolTestCase(unittest.TestCase):
+    def setUp(self):
+        global RESULTS
+
+        context = multiprocessing.get_context('fork')
+        RESULTS = context.Queue()
+        self.pool = shard.ShardPool(2, context=context)
+        self.pool.start()
+
+    def tearDown(self):
+        self.pool.stop()
+        self.pool.join(5)
+
+    def results(self, count):
+        return [RESULTS.get(timeout=5) for _ in range(count)]
+
+    def test_shard_of(self):
+        self.assertEqual(
+            [shard.shard_of('echo{}'.format(idx), 2) for idx in range(4)],
+            [shard.shard_of('echo{}'.format(idx), 2) for idx in range(4)])
+        self.assertEqual(2, len(
+            set(shard.shard_of('echo{}'.format(idx), 2) for idx in range(8))))
+
+    def test_routing(self):
+        names = ['echo{}'.format(idx) for idx in range(8)]
+        for name in names:
+            self.pool.create(name, EchoFSM)
+        self.pool.send_many(
+            (name, Ping(idx)) for idx, name in enumerate(names))
+        pids = {}
+        for name, pid, value in self.results(len(names)):
+            self.assertEqual(names[value], name)
+            pids[name] = pid
+        self.assertEqual(2, len(set(pids.values())))
+        for name in names:
+            self.assertEqual(
+                pids[names[0]] == pids[name],
+                shard.shard_of(names[0], 2) == shard.shard_of(name, 2))
+        # Event.send() routes by name, from this process and between workers
+        target = next(
+            name for name in names
+            if shard.shard_of(name, 2) != shard.shard_of(names[0], 2))
+        Forward(target, 100).send(names[0])
+        self.pool.get(names[0]).send(Forward(target, 101))
+        self.assertEqual(
+            [(target, pids[target], 100), (target, pids[target], 101)],
+            sorted(self.results(2)))
+        self.assertRaises(queue.Empty, RESULTS.get, timeout=0.05)
+
+    def test_full_queue_does_not_stall_shard(self):
+        names = ['stall{}'.format(idx) for idx in range(16)]
+        slow = names[0]
+        other = next(
+            name for name in names[1:]
+            if shard.shard_of(name, 2) == shard.shard_of(slow, 2))
+        self.pool.create(slow, EchoFSM, queue_size=1)
+        self.pool.create(other, EchoFSM)
+        self.pool.send_many([(slow, fsm.Event('stall'))] * 5)
+        self.pool.send(other, Ping(1))
+        started = time.monotonic()
+        self.assertEqual([(other, 1)], [
+            (name, value) for name, _, value in self.results(1)])
+        self.assertLess(time.monotonic() - started, 0.5)
+        # The worker is still alive
+        time.sleep(0.3)
+        self.pool.send(slow, Ping(2))
+        self.assertEqual([(slow, 2)], [
+            (name, value) for name, _, value in self.results(1)])
+
+
+class PoolProviderShardTestCase(ShardPoolTestCase):
+    def setUp(self):
+        global RESULTS
+
+        context = multiprocessing.get_context('fork')
+        RESULTS = context.Queue()
+        self.pool = shard.ShardPool(2, provider='pool', context=context)
+        self.pool.start()
+
+    def test_send_after_create(self):
+        names = ['fresh{}'.format(idx) for idx in range(50)]
+        for idx, name in enumerate(names):
+            self.pool.create(name, EchoFSM)
+            self.pool.get(name).send(Ping(idx))
+        self.assertEqual(
+            sorted(names),
+            sorted(name for name, _, _ in self.results(len(names))))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,227 @@
+'''
+Created on Oct 17, 2026
+'''
+import multiprocessing
+import os
+import queue
+import threading
+import time
+import unittest
+
+from pyeds import coordinator
+from pyeds import fsm
+
+
+class Sample(fsm.Event):
+    def __init__(self, value):
+        super().__init__()
+        self.value = value
+
+
+class SinkFSM(fsm.StateMachine):
+    batch_size = 64
+
+    def __init__(self, name, expected, queue_size=0):
+        self.values = []
+        self.expected = expected
+        self.done = threading.Event()
+        super().__init__(queue_size=queue_size, name=name)
+
+
+@fsm.DeclareState(SinkFSM)
+class Collecting(fsm.State):
+    def on_sample(self, event):
+        self.sm.values += [event.value]
+        if len(self.sm.values) == self.sm.expected:
+            self.sm.done.set()
+
+
+def produce(shm_queue, start, count):
+    shm_queue.put_many(
+        [Sample(value) for value in range(start, start + count)], True)
+
+
+def produce_until_closed(shm_queue, results):
+    try:
+        while True:
+            shm_queue.put_many([Sample(0)], True)
+    except ValueError:
+        results.put('closed')
+
+
+@unittest.skipUnless(
+    hasattr(coordinator, 'ShmQueue'), 'shared memory is not available')
+class ShmQueueTestCase(unittest.TestCase):
+    def setUp(self):
+        self.queue = coordinator.ShmQueue(capacity=256)
+
+    def tearDown(self):
+        self.queue.close()
+
+    def test_put_get(self):
+        self.assertEqual((), self.queue.put(('a', 1)))
+        self.assertEqual([], self.queue.put_many(['b', None, 'c']))
+        self.assertEqual(4, self.queue.qsize())
+        self.assertEqual(('a', 1), self.queue.get())
+        self.assertEqual(['b', None], self.queue.get_many(2))
+        self.assertEqual(['c'], self.queue.clear())
+        self.assertRaises(queue.Empty, self.queue.get, False)
+        self.assertRaises(queue.Empty, self.queue.get, True, 0.01)
+
+    def test_wrap_around(self):
+        for idx in range(50):
+            payload = 'x' * (idx % 40)
+            self.queue.put_many([payload, idx])
+            self.assertEqual([payload, idx], self.queue.get_many(8))
+        self.assertTrue(self.queue.empty())
+
+    def test_full(self):
+        count = 0
+        while True:
+            try:
+                self.queue.put('item{}'.format(count))
+            except BufferError:
+                break
+            count += 1
+        self.assertRaises(BufferError, self.queue.put, 'item', True, 0.01)
+        with self.assertRaises(BufferError) as context:
+            self.queue.put_many(['a', 'b'])
+        self.assertEqual((0, []), context.exception.args)
+        self.assertEqual(count, len(self.queue.get_many(count)))
+        self.assertRaises(ValueError, self.queue.put, 'x' * 256)
+
+    def test_maxsize_and_drop_newest(self):
+        shm_queue = coordinator.ShmQueue(2, 'drop_newest', capacity=256)
+        try:
+            self.assertEqual(['c'], shm_queue.put_many(['a', 'b', 'c']))
+            self.assertEqual(('d',), shm_queue.put('d'))
+            self.assertEqual(2, shm_queue.dropped)
+            self.assertEqual(['a', 'b'], shm_queue.get_many(8))
+        finally:
+            shm_queue.close()
+        self.assertRaises(
+            ValueError, coordinator.ShmQueue, overflow='drop_oldest')
+
+    def test_termination_is_always_accepted(self):
+        shm_queue = coordinator.ShmQueue(2, 'reject', capacity=256)
+        try:
+            shm_queue.put_many(['a', 'b'])
+            self.assertRaises(BufferError, shm_queue.put, 'c')
+            self.assertEqual((), shm_queue.put(None))
+            while True:
+                try:
+                    self.queue.put('item')
+                except BufferError:
+                    break
+            self.assertEqual((), self.queue.put(None))
+            self.assertEqual(None, self.queue.clear()[-1])
+        finally:
+            shm_queue.close()
+
+    def test_close(self):
+        shm_queue = coordinator.ShmQueue(capacity=256)
+        shm_queue.put('a')
+        shm_queue.close()
+        shm_queue.close()
+        self.assertEqual([], shm_queue.clear())
+        self.assertRaises(ValueError, shm_queue.put, 'b')
+
+    def test_blocked_consumer_is_woken(self):
+        taken = []
+        consumer = threading.Thread(
+            target=lambda: taken.extend(self.queue.get_many(8, True, 5)))
+        consumer.start()
+        self.queue.put('late')
+        consumer.join(5)
+        self.assertEqual(['late'], taken)
+
+    def test_payload(self):
+        frame = bytes(range(40))
+        self.queue.put(fsm.Event('frame', payload=frame))
+        self.assertEqual(frame, self.queue.get().payload.tobytes())
+        self.queue.put_many([Sample(1), fsm.Event('frame', payload=frame)])
+        events = self.queue.get_many(8)
+        self.assertEqual(['sample', 'frame'], [e.name for e in events])
+        self.assertEqual(frame, events[1].payload.tobytes())
+
+    def test_closed_for_producer_processes(self):
+        context = multiprocessing.get_context('fork')
+        shm_queue = coordinator.ShmQueue(4, capacity=4096)
+        results = context.Queue()
+        producer = context.Process(
+            target=produce_until_closed, args=(shm_queue, results),
+            daemon=True)
+        producer.start()
+        # The producer fills the queue and waits for room
+        deadline = time.monotonic() + 5
+        while shm_queue.qsize() < 4 and time.monotonic() < deadline:
+            time.sleep(0.001)
+        shm_queue.close()
+        self.assertEqual('closed', results.get(timeout=5))
+        producer.join(5)
+        self.assertFalse(producer.is_alive())
+
+    def test_attach(self):
+        # What a producer process gets when the queue is pickled for it
+        attached = coordinator.ShmQueue.__new__(coordinator.ShmQueue)
+        attached.__setstate__(self.queue.__getstate__())
+        try:
+            self.assertEqual(self.queue.name, attached.name)
+            self.queue.put('shared')
+            attached.put('from producer')
+            self.assertEqual(
+                ['shared', 'from producer'], self.queue.get_many(8))
+        finally:
+            attached.close()
+
+
+@unittest.skipUnless(
+    hasattr(coordinator, 'ShmQueue'), 'shared memory is not available')
+class ShmProviderTestCase(unittest.TestCase):
+    def setUp(self):
+        coordinator.set_provider('shm')
+
+    def tearDown(self):
+        coordinator.set_provider('std')
+
+    def test_producer_processes(self):
+        context = multiprocessing.get_context('fork')
+        sm = SinkFSM('shm_sink', 4000)
+        self.assertIsInstance(sm.queue, coordinator.ShmQueue)
+        self.assertFalse(sm.should_register_events)
+        producers = [
+            context.Process(target=produce, args=(sm.queue, idx * 1000, 1000))
+            for idx in range(3)]
+        for producer in producers:
+            producer.start()
+        sm.send_many([Sample(value) for value in range(3000, 4000)])
+        for producer in producers:
+            producer.join(10)
+        self.assertTrue(sm.done.wait(10))
+        self.assertEqual(list(range(4000)), sorted(sm.values))
+        # Events of one producer keep their order
+        first = [value for value in sm.values if value < 1000]
+        self.assertEqual(list(range(1000)), first)
+        sm.do_terminate()
+        sm.wait()
+        sm.queue.close()
+
+    def test_terminate_full_queue(self):
+        class LazySinkFSM(SinkFSM):
+            should_autostart = False
+
+        sm = LazySinkFSM('shm_full', 2, queue_size=2)
+        name = sm.queue.name
+        sm.send_many([Sample(1), Sample(2)])
+        self.assertRaises(BufferError, sm.send, Sample(3), False)
+        sm.do_terminate()
+        sm.do_start()
+        sm.wait()
+        self.assertEqual([1, 2], sm.values)
+        # The shared memory is destroyed with the state machine
+        if os.path.isdir('/dev/shm'):
+            self.assertFalse(os.path.exists(os.path.join('/dev/shm', name)))
+
+
+if __name__ == '__main__':
+    unittest.main()
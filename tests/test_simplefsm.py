@@ -18,6 +18,14 @@ class SimpleFSM(fsm.StateMachine):
         super().__init__()
 
 
+class UnregisteredEventsFSM(SimpleFSM):
+    should_register_events = False
+
+
+class BatchedFSM(SimpleFSM):
+    batch_size = 4
+
+
 class CommonStateClass(fsm.State):
     def __init__(self):
         super().__init__()
@@ -229,6 +237,77 @@ class FsmTestCase(unittest.TestCase):
             expected,
             '{} is not as expected {}'.format(retval, expected))
 
+    def test_fsm_instances_are_independent(self):
+        sm1 = SimpleFSM()
+        sm1.send(fsm.Event('a'))
+        sm1.do_terminate()
+        sm1.wait()
+        sm2 = SimpleFSM()
+        sm2.do_terminate()
+        sm2.wait()
+        self.assertIsNot(
+            sm1.instance_of(StateA1),
+            sm2.instance_of(StateA1))
+        self.assertIs(sm1.state, sm1.instance_of(StateA2))
+        self.assertIs(sm2.state, sm2.instance_of(StateA1))
+        self.assertEqual(sm1.states, sm2.states)
+
+    def test_fsm_unregistered_events(self):
+        expected = [
+            'StateA1:i',
+            'StateA1:x',
+            'StateA2:e',
+            'StateA2:i'
+            ]
+        sm = UnregisteredEventsFSM()
+        event = fsm.Event('a')
+        sm.send(event)
+        self.assertNotIn(event, fsm.Resource.get_resources('event', 'a'))
+        sm.do_terminate()
+        sm.wait()
+        retval = sm.out_seq
+        self.assertEqual(
+            retval,
+            expected,
+            '{} is not as expected {}'.format(retval, expected))
+
+    def test_fsm_batched_events(self):
+        sm = BatchedFSM()
+        events = [fsm.Event('a') for _ in range(7)]
+        for event in events:
+            sm.send(event)
+        sm.do_terminate()
+        sm.wait()
+        expected = ['StateA1:i']
+        for idx in range(1, 8):
+            expected += [
+                'StateA{}:x'.format(idx),
+                'StateA{}:e'.format(idx % 7 + 1),
+                'StateA{}:i'.format(idx % 7 + 1)]
+        self.assertEqual(expected, sm.out_seq)
+        for event in events:
+            self.assertNotIn(event, fsm.Resource.get_resources('event', 'a'))
+
+    def test_fsm_batched_termination(self):
+        class LazyBatchedFSM(SimpleFSM):
+            should_autostart = False
+            batch_size = 8
+
+        sm = LazyBatchedFSM()
+        events = [fsm.Event('a') for _ in range(3)]
+        sm.send(events[0])
+        sm.do_terminate()
+        sm.send(events[1])
+        sm.send(events[2])
+        sm.do_start()
+        sm.wait()
+        self.assertEqual(
+            ['StateA1:i', 'StateA1:x', 'StateA2:e', 'StateA2:i'], sm.out_seq)
+        # Events taken with the termination request are not left behind
+        for event in events:
+            self.assertNotIn(event, fsm.Resource.get_resources('event', 'a'))
+        self.assertEqual(0, sm.queue.unfinished_tasks)
+
 
 if __name__ == '__main__':
     unittest.main()
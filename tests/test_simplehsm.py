@@ -140,6 +140,36 @@ class HsmTestCase(unittest.TestCase):
             expected,
             '{} is not as expected {}'.format(retval, expected))
 
+    def test_hsm_event_bubbling(self):
+        event_ids = ('b', 'a', 'b', 'c')
+        expected = (
+            'StateA:i',
+            'StateA:b',
+            'StateA1:e',
+            'StateA1:i',
+            'StateA:a',
+            'StateA1:x',
+            'StateA:i',
+            'StateA:b',
+            'StateA1:e',
+            'StateA1:i',
+            'StateA:c',
+            'StateA1:x',
+            'StateA:x',
+            'StateB:e',
+            'StateB:i'
+            )
+        sm = SimpleHSM()
+        for event_id in event_ids:
+            sm.send(fsm.Event(event_id))
+        sm.do_terminate()
+        sm.wait()
+        retval = sm.out_seq
+        self.assertEqual(
+            tuple(retval),
+            expected,
+            '{} is not as expected {}'.format(retval, expected))
+
 
 if __name__ == '__main__':
     unittest.main()
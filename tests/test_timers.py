@@ -0,0 +1,154 @@
+'''
+Created on Oct 17, 2026
+'''
+import logging
+import threading
+import time
+import unittest
+
+from pyeds import fsm
+
+
+class TimerFSM(fsm.StateMachine):
+    def __init__(self):
+        self.ticks = []
+        self.done = threading.Event()
+        super().__init__()
+
+
+@fsm.DeclareState(TimerFSM)
+class Ticking(fsm.State):
+    def on_init(self):
+        fsm.Every(0.01, 'tick', shared_event=True)
+
+    def on_tick(self, event):
+        self.sm.ticks.append(event)
+        if len(self.sm.ticks) == 3:
+            event.timer.cancel()
+            self.sm.done.set()
+
+
+class ManyTimersFSM(fsm.StateMachine):
+    def __init__(self):
+        self.ticks = 0
+        self.threads = None
+        self.done = threading.Event()
+        super().__init__(queue_size=-1)
+
+
+@fsm.DeclareState(ManyTimersFSM)
+class Waiting(fsm.State):
+    def on_init(self):
+        for idx in range(200):
+            fsm.After(0.01 + idx * 0.0001, 'tick')
+        # One of them is cancelled
+        fsm.After(0.01, 'tick').cancel()
+        self.sm.threads = threading.active_count()
+
+    def on_tick(self, event):
+        self.sm.ticks += 1
+        if self.sm.ticks == 200:
+            self.sm.done.set()
+
+
+class EndlessFSM(fsm.StateMachine):
+    def __init__(self):
+        self.ticking = threading.Event()
+        super().__init__()
+
+
+@fsm.DeclareState(EndlessFSM)
+class Endless(fsm.State):
+    def on_init(self):
+        self.sm.timer = fsm.Every(0.001, 'tick')
+
+    def on_tick(self, event):
+        self.sm.ticking.set()
+
+
+class TimerTestCase(unittest.TestCase):
+    def test_after_many(self):
+        threads = threading.active_count()
+        sm = ManyTimersFSM()
+        self.assertTrue(sm.done.wait(5))
+        sm.do_terminate()
+        sm.wait()
+        self.assertEqual(200, sm.ticks)
+        # Machine thread and at most one timer service thread
+        self.assertLessEqual(sm.threads, threads + 2)
+        # Expired and cancelled timers are released
+        self.assertEqual(
+            [], fsm.Resource.filter_resources(category='timer', owner=sm))
+
+    def test_termination_cancels_timers(self):
+        sm = EndlessFSM()
+        self.assertTrue(sm.ticking.wait(5))
+        self.assertEqual(
+            [sm.timer],
+            fsm.Resource.filter_resources(category='timer', owner=sm))
+        sm.do_terminate()
+        sm.wait()
+        self.assertFalse(sm.timer._is_running)
+        self.assertEqual(
+            [], fsm.Resource.filter_resources(category='timer', owner=sm))
+
+    def test_every_shared_event(self):
+        sm = TimerFSM()
+        self.assertTrue(sm.done.wait(5))
+        sm.do_terminate()
+        sm.wait()
+        first = sm.ticks[0]
+        self.assertEqual('tick', first.name)
+        for event in sm.ticks:
+            self.assertIs(first, event)
+
+
+
+class FakeOwner:
+    name = 'fake'
+    logger = logging.getLogger()
+
+    def __init__(self):
+        self.events = []
+
+    def _send_timer_events(self, events):
+        self.events += events
+
+
+class EveryMissedTestCase(unittest.TestCase):
+    def late_tick(self, missed):
+        timer = fsm.Every(10.0, 'tick', missed=missed)
+        timer.sm = FakeOwner()
+        # Pretend the expiry is 2.5 periods late
+        timer._deadline = time.monotonic() - 25.0
+        timer.handler()
+        timer.cancel()
+        return timer
+
+    def test_catch_up(self):
+        timer = self.late_tick('catch_up')
+        self.assertEqual(3, len(timer.sm.events))
+        self.assertEqual(0, timer.missed_ticks)
+
+    def test_coalesce(self):
+        timer = self.late_tick('coalesce')
+        self.assertEqual(1, len(timer.sm.events))
+        self.assertEqual(2, timer.missed_ticks)
+
+    def test_skip(self):
+        timer = self.late_tick('skip')
+        self.assertEqual(0, len(timer.sm.events))
+        self.assertEqual(3, timer.missed_ticks)
+
+    def test_lateness(self):
+        timer = self.late_tick('coalesce')
+        self.assertEqual(1, timer.lateness.count)
+        self.assertGreaterEqual(timer.lateness.max, 25.0)
+        self.assertEqual(0.0, timer.jitter)
+
+    def test_invalid_policy(self):
+        self.assertRaises(ValueError, fsm.Every, 1.0, 'tick', missed='x')
+
+
+if __name__ == '__main__':
+    unittest.main()
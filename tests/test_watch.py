@@ -0,0 +1,227 @@
+'''
+Created on Oct 17, 2026
+'''
+import asyncio
+import os
+import selectors
+import socket
+import threading
+import time
+import unittest
+
+from pyeds import coordinator
+from pyeds import fsm
+
+
+class ConnectionFSM(fsm.StateMachine):
+    def __init__(self, name, sock):
+        self.sock = sock
+        self.received = []
+        self.closed = threading.Event()
+        super().__init__(name=name)
+
+
+@fsm.DeclareState(ConnectionFSM)
+class Connected(fsm.State):
+    def on_init(self):
+        self.set_local(fsm.Watch(self.sm.sock, 'data', read_size=4))
+
+    def on_data(self, event):
+        if not event.payload:
+            return Closed
+        self.sm.received += [event.payload.tobytes()]
+
+
+@fsm.DeclareState(ConnectionFSM)
+class Closed(fsm.State):
+    def on_entry(self):
+        self.sm.closed.set()
+
+
+class PipeFSM(fsm.StateMachine):
+    def __init__(self, name, fd):
+        self.fd = fd
+        self.chunks = []
+        self.readable = threading.Event()
+        super().__init__(name=name)
+
+
+@fsm.DeclareState(PipeFSM)
+class Reading(fsm.State):
+    def on_init(self):
+        fsm.Watch(self.sm.fd, 'readable')
+
+    def on_readable(self, event):
+        self.sm.chunks += [os.read(self.sm.fd, 1024)]
+        self.sm.readable.set()
+        event.watch.start()
+
+
+class BusyPipeFSM(fsm.StateMachine):
+    def __init__(self, name, fd):
+        self.fd = fd
+        self.gate = threading.Event()
+        self.readable = threading.Event()
+        super().__init__(queue_size=1, name=name)
+
+
+@fsm.DeclareState(BusyPipeFSM)
+class Busy(fsm.State):
+    def on_init(self):
+        fsm.Watch(self.sm.fd, 'readable')
+
+    def on_busy(self, event):
+        self.sm.gate.wait(5)
+
+    def on_readable(self, event):
+        self.sm.readable.set()
+
+
+def watches_of(sm):
+    return [
+        watch for watch in fsm.Resource.filter_resources(category='watch')
+        if watch.sm is sm]
+
+
+class IoServiceTestCase(unittest.TestCase):
+    def setUp(self):
+        self.service = coordinator.IoService()
+        self.reader, self.writer = socket.socketpair()
+
+    def tearDown(self):
+        self.reader.close()
+        self.writer.close()
+
+    def test_watch_and_cancel(self):
+        ready = threading.Event()
+        writable = threading.Event()
+        entry = [self.reader, selectors.EVENT_READ, ready.set]
+        write_entry = [self.reader, selectors.EVENT_WRITE, writable.set]
+        self.service.watch(entry)
+        self.service.watch(write_entry)
+        self.assertTrue(writable.wait(5))
+        self.assertFalse(ready.is_set())
+        self.writer.send(b'x')
+        self.assertTrue(ready.wait(5))
+        self.service.cancel(write_entry)
+        self.service.cancel(entry)
+        self.service.cancel(entry)
+        # The socket is closed only after the service has stopped watching it
+        deadline = time.monotonic() + 5
+        while time.monotonic() < deadline:
+            try:
+                self.service._selector.get_key(self.reader)
+            except KeyError:
+                break
+            time.sleep(0.001)
+        self.assertRaises(KeyError, self.service._selector.get_key, self.reader)
+
+    def test_closed_file_object(self):
+        ready = threading.Event()
+        for _ in range(3):
+            closed, other = socket.socketpair()
+            closed.close()
+            other.close()
+            # Watching a closed socket does not stop the service
+            with self.assertLogs('pyeds.coordinator', 'ERROR'):
+                self.service.watch(
+                    [closed, selectors.EVENT_READ, ready.set])
+                entry = [self.reader, selectors.EVENT_READ, ready.set]
+                self.service.watch(entry)
+                self.writer.send(b'x')
+                self.assertTrue(ready.wait(5))
+            self.service.cancel(entry)
+            self.reader.recv(16)
+            ready.clear()
+
+
+class WatchTestCase(unittest.TestCase):
+    def test_read_until_closed(self):
+        local, remote = socket.socketpair()
+        try:
+            sm = ConnectionFSM('connection', local)
+            remote.sendall(b'hello world')
+            remote.close()
+            self.assertTrue(sm.closed.wait(5))
+            self.assertEqual(b'hello world', b''.join(sm.received))
+            self.assertTrue(all(len(chunk) <= 4 for chunk in sm.received))
+            # The watch was local to the exited state
+            self.assertEqual([], watches_of(sm))
+            sm.do_terminate()
+            sm.wait()
+        finally:
+            local.close()
+
+    def test_readiness(self):
+        read_fd, write_fd = os.pipe()
+        try:
+            sm = PipeFSM('pipe', read_fd)
+            for chunk in (b'first', b'second'):
+                sm.readable.clear()
+                os.write(write_fd, chunk)
+                self.assertTrue(sm.readable.wait(5))
+            self.assertEqual(b'firstsecond', b''.join(sm.chunks))
+            self.assertEqual(1, len(watches_of(sm)))
+            sm.do_terminate()
+            sm.wait()
+            self.assertEqual([], watches_of(sm))
+        finally:
+            os.close(read_fd)
+            os.close(write_fd)
+
+    def test_full_queue(self):
+        read_fd, write_fd = os.pipe()
+        other_read_fd, other_write_fd = os.pipe()
+        try:
+            sm = BusyPipeFSM('busy_pipe', read_fd)
+            sm.send(fsm.Event('busy'))
+            # Wait for the handler to block before filling the queue
+            while sm.queue.qsize():
+                time.sleep(0.001)
+            sm.send(fsm.Event('filler'))
+            os.write(write_fd, b'x')
+            # The watching thread still serves other file objects
+            ready = threading.Event()
+            entry = [other_read_fd, selectors.EVENT_READ, ready.set]
+            coordinator.io_service.watch(entry)
+            os.write(other_write_fd, b'x')
+            self.assertTrue(ready.wait(5))
+            coordinator.io_service.cancel(entry)
+            self.assertFalse(sm.readable.is_set())
+            # The readiness event is sent again once there is room
+            sm.gate.set()
+            self.assertTrue(sm.readable.wait(5))
+            sm.do_terminate()
+            sm.wait()
+        finally:
+            for fd in (read_fd, write_fd, other_read_fd, other_write_fd):
+                os.close(fd)
+
+
+@unittest.skipUnless('asyncio' in coordinator.providers, 'requires asyncio')
+class AsyncioWatchTestCase(unittest.TestCase):
+    def setUp(self):
+        coordinator.set_provider('asyncio')
+
+    def tearDown(self):
+        coordinator.set_provider('std')
+
+    def test_read_in_loop(self):
+        async def main():
+            local, remote = socket.socketpair()
+            sm = ConnectionFSM('async_connection', local)
+            remote.sendall(b'from the loop')
+            remote.close()
+            while not sm.closed.is_set():
+                await asyncio.sleep(0.01)
+            sm.do_terminate()
+            await sm.wait()
+            local.close()
+            return sm
+
+        sm = asyncio.run(asyncio.wait_for(main(), 5))
+        self.assertEqual(b'from the loop', b''.join(sm.received))
+
+
+if __name__ == '__main__':
+    unittest.main()